@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the modules of formularesolver import each other by their flat names
+FORMULARESOLVER = str(Path(__file__).resolve().parents[1] / "formularesolver")
+if FORMULARESOLVER not in sys.path:
+    sys.path.insert(0, FORMULARESOLVER)
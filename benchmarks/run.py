@@ -0,0 +1,221 @@
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from parser import parser
+from pathlib import Path
+from typing import Callable
+
+from benchmarks import sheets
+from interpreter import (compile_formula, formula_resolver,
+                         formula_resolver_many, interpreter, parse_formula)
+from lexer import lexer
+from main import csv2variables, variables2csv
+from rangeindex import RangeIndex
+
+THRESHOLD = 0.25  # slowdown ratio above which a benchmark is a regression
+LONG_FORMULA_TERMS = 12_500  # about 100k tokens
+
+Benchmark = Callable[[float, Path], Callable[[], object]]  # (scale, tmp) -> run
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    "registers a benchmark, its setup returns the function that is timed"
+
+    def register(setup: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def clear_caches() -> None:
+    parse_formula.cache_clear()
+    compile_formula.cache_clear()
+
+
+def sized(n: int, scale: float) -> int:
+    return max(1, int(n * scale))
+
+
+@benchmark("lexer.long_formula")
+def bench_lexer(scale: float, tmp: Path):
+    formula = sheets.long_formula(sized(LONG_FORMULA_TERMS, scale))
+    return lambda: list(lexer(formula))
+
+
+@benchmark("parser.long_formula")
+def bench_parser(scale: float, tmp: Path):
+    tokens = list(lexer(sheets.long_formula(sized(LONG_FORMULA_TERMS, scale))))
+    return lambda: parser(tokens)
+
+
+@benchmark("interpreter.long_formula")
+def bench_interpreter(scale: float, tmp: Path):
+    ast = parse_formula(sheets.long_formula(sized(LONG_FORMULA_TERMS, scale)))
+    variables = {f"{col}{row}": row for col in "AB" for row in range(1, 10)}
+    return lambda: interpreter(ast, variables)
+
+
+@benchmark("compiled.long_formula")
+def bench_compiled(scale: float, tmp: Path):
+    evaluate = compile_formula(sheets.long_formula(sized(LONG_FORMULA_TERMS, scale)))
+    variables = {f"{col}{row}": row for col in "AB" for row in range(1, 10)}
+    return lambda: evaluate(variables)
+
+
+def distinct_formulas(scale: float) -> tuple[list[str], dict]:
+    n_formulas = sized(2000, scale)
+    formulas = [f"A{n} * 2 + SUM(A1:B{n % 9 + 1})" for n in range(1, n_formulas + 1)]
+    variables = {f"{col}{n}": n for col in "AB" for n in range(1, n_formulas + 1)}
+    return formulas, variables
+
+
+@benchmark("formula_resolver.cold")
+def bench_resolver_cold(scale: float, tmp: Path):
+    "every formula is lexed, parsed and compiled"
+    formulas, variables = distinct_formulas(scale)
+
+    def run():
+        clear_caches()
+        for formula in formulas:
+            formula_resolver(formula, variables)
+
+    return run
+
+
+@benchmark("formula_resolver.cached")
+def bench_resolver_cached(scale: float, tmp: Path):
+    formulas, variables = distinct_formulas(scale)
+    for formula in formulas:
+        formula_resolver(formula, variables)
+    return lambda: [formula_resolver(formula, variables) for formula in formulas]
+
+
+@benchmark("formula_resolver.many")
+def bench_resolver_many(scale: float, tmp: Path):
+    formulas, variables = distinct_formulas(scale)
+    pairs = [(formula, variables) for formula in formulas]
+    return lambda: list(formula_resolver_many(pairs))
+
+
+def main_benchmark(
+    name: str, sheet: Callable[[float], sheets.Sheet], index: bool = False
+) -> None:
+    "end to end processing of a csv file, like `python main.py file.csv`"
+
+    @benchmark(f"main.{name}")
+    def bench_main(scale: float, tmp: Path):
+        filename = str(tmp / f"{name}.csv")
+        sheets.write_csv(sheet(scale), filename)
+
+        def run():
+            clear_caches()
+            variables = csv2variables(filename)
+            if index:  # python main.py --index file.csv
+                variables.range_index = RangeIndex(variables.grid)
+            return "".join(variables2csv(variables))
+
+        return run
+
+
+main_benchmark("wide", lambda scale: sheets.wide(sized(2000, scale)))
+main_benchmark("tall", lambda scale: sheets.tall(sized(5000, scale)))
+main_benchmark("chain", lambda scale: sheets.chain(sized(5000, scale)))
+main_benchmark("ranges", lambda scale: sheets.ranges(sized(2000, scale)))
+main_benchmark("sums", lambda scale: sheets.sums(sized(2000, scale)))
+main_benchmark("sums_index", lambda scale: sheets.sums(sized(2000, scale)), True)
+main_benchmark("blocks", lambda scale: sheets.blocks(sized(2000, scale)))
+main_benchmark("blocks_index", lambda scale: sheets.blocks(sized(2000, scale)), True)
+main_benchmark("windows", lambda scale: sheets.ranges(sized(2000, scale), 1000))
+main_benchmark(
+    "windows_index", lambda scale: sheets.ranges(sized(2000, scale), 1000), True
+)
+
+
+def time_best(run: Callable[[], object], repeat: int) -> float:
+    "best wall time of several runs, the least disturbed by the rest of the machine"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmarks(
+    names: list[str], scale: float = 1.0, repeat: int = 5
+) -> dict[str, float]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            results[name] = time_best(BENCHMARKS[name](scale, Path(tmp)), repeat)
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], threshold: float
+) -> list[str]:
+    "the benchmarks slower than their baseline by more than the threshold ratio"
+    return [
+        f"{name}: {baseline[name]:.6f}s -> {seconds:.6f}s"
+        for name, seconds in results.items()
+        if name in baseline and seconds > baseline[name] * (1 + threshold)
+    ]
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="times the hot paths")
+    arg_parser.add_argument(
+        "names", nargs="*", help="benchmarks to run (prefixes), all by default"
+    )
+    arg_parser.add_argument("-o", "--output", help="write the results to a json file")
+    arg_parser.add_argument("--compare", help="json results of a previous run")
+    arg_parser.add_argument(
+        "--threshold", type=float, default=THRESHOLD, help="allowed slowdown ratio"
+    )
+    arg_parser.add_argument("--scale", type=float, default=1.0, help="sheet sizes")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    return arg_parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    names = [
+        name
+        for name in BENCHMARKS
+        if not args.names or any(name.startswith(prefix) for prefix in args.names)
+    ]
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)["results"]
+
+    results = run_benchmarks(names, scale=args.scale, repeat=args.repeat)
+    for name, seconds in results.items():
+        line = f"{name:<28}{seconds * 1000:>12.3f} ms"
+        if name in baseline:
+            line += f"{seconds / baseline[name]:>10.2f}x"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            report = {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "scale": args.scale,
+                "results": results,
+            }
+            json.dump(report, json_file, indent=2)
+
+    if regressions := compare(results, baseline, args.threshold):
+        print(f"regressions above {args.threshold:.0%}:", *regressions, sep="\n  ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
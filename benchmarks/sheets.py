@@ -0,0 +1,86 @@
+import csv
+import random
+
+from utils import cell_name
+
+Sheet = list[list[str]]  # csv rows of raw cells
+
+
+def wide(n_cols: int, n_rows: int = 20) -> Sheet:
+    "few rows of many columns, the last row sums each column"
+    rows = [[str(row + col) for col in range(n_cols)] for row in range(n_rows)]
+    last = n_rows - 1
+    sums = [f"=SUM({cell_name(0, c)}:{cell_name(last, c)})" for c in range(n_cols)]
+    return rows + [sums]
+
+
+def tall(n_rows: int) -> Sheet:
+    "many rows of numbers with formulas filled down, like a ledger"
+    rows = []
+    for row in range(1, n_rows + 1):
+        rows.append(
+            [
+                str(row),
+                str(row % 7 + 0.5),
+                f"=A{row} * B{row} + MAX(A{row}:B{row})",
+                f"=IF(C{row} > 100, C{row} - A{row}, 0)",
+            ]
+        )
+    return rows
+
+
+def chain(depth: int) -> Sheet:
+    "a single column where each cell reads the previous one"
+    return [["1"]] + [[f"=A{row} + 1"] for row in range(1, depth)]
+
+
+def ranges(n_formulas: int, window: int = 50) -> Sheet:
+    "formulas over overlapping ranges of a numeric column"
+    rng = random.Random(0)
+    rows = [[str(rng.randint(0, 1000))] for _ in range(n_formulas + window)]
+    for row in range(n_formulas):
+        stop = row + window
+        rows[row].append(f"=SUM(A{row + 1}:A{stop}) / MAX(A{row + 1}:A{stop})")
+    return rows
+
+
+def sums(n_formulas: int, window: int = 1000) -> Sheet:
+    "sums over overlapping windows of a numeric column, like running totals"
+    rows = [[str(row % 97)] for row in range(n_formulas + window)]
+    for row in range(n_formulas):
+        rows[row].append(f"=SUM(A{row + 1}:A{row + window})")
+    return rows
+
+
+def blocks(n_formulas: int, n_cols: int = 8, window: int = 500) -> Sheet:
+    "sums over overlapping windows of several numeric columns"
+    rows = [
+        [str((row + col) % 97) for col in range(n_cols)]
+        for row in range(n_formulas + window)
+    ]
+    last = cell_name(0, n_cols - 1).rstrip("1")
+    for row in range(n_formulas):
+        rows[row].append(f"=SUM(A{row + 1}:{last}{row + window})")
+    return rows
+
+
+def long_formula(n_terms: int) -> str:
+    "a single formula with many terms, functions and nested parentheses"
+    rng = random.Random(0)
+    terms = []
+    for n in range(n_terms):
+        match n % 4:
+            case 0:
+                terms.append(f"{rng.randint(1, 99)} * A{rng.randint(1, 9)}")
+            case 1:
+                terms.append(f"MAX(A1:B{rng.randint(1, 9)}, {rng.random():.3f})")
+            case 2:
+                terms.append(f"(B{rng.randint(1, 9)} - {rng.randint(1, 99)}) ^ 2")
+            case 3:
+                terms.append(f"IF(A{rng.randint(1, 9)} > 5, 1, -1)")
+    return " + ".join(terms)
+
+
+def write_csv(sheet: Sheet, filename: str) -> None:
+    with open(filename, "w", newline="") as csv_file:
+        csv.writer(csv_file).writerows(sheet)
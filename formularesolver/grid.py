@@ -0,0 +1,124 @@
+import re
+from array import array
+from typing import Iterator
+
+# cell kinds
+EMPTY, INT, FLOAT, TEXT = 0, 1, 2, 3
+
+# only canonical numbers are stored as numbers, so raw cells round trip
+RE_INT = re.compile(r"-?[0-9]+").fullmatch
+RE_FLOAT = re.compile(r"-?[0-9]+\.[0-9]+").fullmatch
+MAX_EXACT_INT = 2**53  # ints stored in a double without loss of precision
+
+
+def classify(raw: str) -> tuple[int, float]:
+    "returns the kind of a raw cell and its numeric value"
+    if raw == "":
+        return EMPTY, 0.0
+    if RE_INT(raw) and str(n := int(raw)) == raw and abs(n) <= MAX_EXACT_INT:
+        return INT, float(n)
+    if RE_FLOAT(raw) and repr(x := float(raw)) == raw:
+        return FLOAT, x
+    return TEXT, 0.0
+
+
+class Grid:
+    """compact storage of raw cells addressed by zero based (row, col)
+
+    numeric cells live in typed columns (one byte of kind and one double per
+    cell), formulas and text cells live in a sparse map"""
+
+    def __init__(self) -> None:
+        self.kinds: list[array] = []  # one array("b") of cell kinds per column
+        self.numbers: list[array] = []  # one array("d") of numbers per column
+        self.texts: dict[tuple[int, int], str] = {}  # formulas and text cells
+        self.n_rows = 0
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.n_rows, len(self.kinds)
+
+    def __getitem__(self, index: tuple[int, int]) -> str:
+        "returns the raw content of a cell, empty string for empty cells"
+        value = self.cell(*index)
+        return value if isinstance(value, str) else repr(value)
+
+    def __setitem__(self, index: tuple[int, int], raw: str) -> None:
+        row, col = index
+        kind, number = classify(raw)
+        self.reserve(row, col)
+        self.kinds[col][row] = kind
+        self.numbers[col][row] = number
+        if kind == TEXT:
+            self.texts[index] = raw
+        else:
+            self.texts.pop(index, None)
+
+    def __delitem__(self, index: tuple[int, int]) -> None:
+        row, col = index
+        if self.kind(row, col) != EMPTY:
+            self.kinds[col][row] = EMPTY
+            self.numbers[col][row] = 0.0
+            self.texts.pop(index, None)
+
+    def __contains__(self, index: tuple[int, int]) -> bool:
+        return self.kind(*index) != EMPTY
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        "iterates over the non empty cells in row major order"
+        for row in range(self.n_rows):
+            for col, kinds in enumerate(self.kinds):
+                if row < len(kinds) and kinds[row] != EMPTY:
+                    yield row, col
+
+    def __len__(self) -> int:
+        return sum(len(kinds) - kinds.count(EMPTY) for kinds in self.kinds)
+
+    def reserve(self, row: int, col: int) -> None:
+        "grows the columns so the position (row, col) can be stored"
+        if row < 0 or col < 0:
+            raise IndexError(f"invalid cell position: {(row, col)}")
+        while len(self.kinds) <= col:
+            self.kinds.append(array("b"))
+            self.numbers.append(array("d"))
+        kinds, numbers = self.kinds[col], self.numbers[col]
+        if (missing := row + 1 - len(kinds)) > 0:
+            kinds.frombytes(bytes(missing * kinds.itemsize))
+            numbers.frombytes(bytes(missing * numbers.itemsize))
+        self.n_rows = max(self.n_rows, row + 1)
+
+    def kind(self, row: int, col: int) -> int:
+        if col < len(self.kinds) and row < len(self.kinds[col]):
+            return self.kinds[col][row]
+        return EMPTY
+
+    def cell(self, row: int, col: int) -> int | float | str:
+        "returns numbers for numeric cells and the raw string otherwise"
+        kind = self.kind(row, col)
+        if kind == INT:
+            return int(self.numbers[col][row])
+        if kind == FLOAT:
+            return self.numbers[col][row]
+        if kind == TEXT:
+            return self.texts[row, col]
+        return ""
+
+    def numeric_block(
+        self, row0: int, col0: int, row1: int, col1: int
+    ) -> tuple[int, list[array]] | None:
+        """returns the kind and the column slices of a rectangle when all of its
+        cells are numbers of the same kind, None otherwise"""
+        size = row1 - row0 + 1
+        block_kind, slices = None, []
+        for col in range(col0, col1 + 1):
+            if col >= len(self.kinds) or len(self.kinds[col]) <= row1:
+                return None
+            kinds = self.kinds[col][row0 : row1 + 1]
+            kind = kinds[0]
+            if kind not in (INT, FLOAT) or kinds.count(kind) != size:
+                return None
+            if block_kind not in (None, kind):
+                return None
+            block_kind = kind
+            slices.append(self.numbers[col][row0 : row1 + 1])
+        return block_kind, slices
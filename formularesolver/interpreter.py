@@ -1,93 +1,492 @@
 import math
 import operator
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice, repeat
 from parser import (ASTNode, ConstantNode, FunctionNode, ParenthesesNode,
                     VariableNode, parser)
-from typing import Callable
+from typing import Callable, Container, Iterable, Iterator, Sequence
 
+from grid import INT
 from lexer import Token, lexer
-from utils import excel_range
+from optimizer import bottom_up, optimize, shared_subtrees
+from utils import bounds_cells, cell_name, range_bounds
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def range_operator(a: str, b: str, variables: dict) -> list:
-    return [variables.get(v) for v in excel_range(a, b)]
 
+class RangeRef:
+    "lazy reference to the cells of a excel range, resolved against the variables"
 
-OPERATIONS: dict[str, Callable] = {
+    __slots__ = ("bounds", "variables")
+
+    def __init__(self, bounds: tuple[int, int, int, int], variables) -> None:
+        self.bounds = bounds  # zero based (row0, col0, row1, col1), inclusive
+        self.variables = variables
+
+    def __len__(self) -> int:
+        row0, col0, row1, col1 = self.bounds
+        return (row1 - row0 + 1) * (col1 - col0 + 1)
+
+    def __iter__(self) -> Iterator:
+        "iterates over the values of the range, column by column"
+        # sheets read ranges from their storage, other mappings by cell name
+        if hasattr(self.variables, "range_values"):
+            return iter(self.variables.range_values(self))
+        return map(self.variables.get, range_cells(self.bounds))
+
+    def __repr__(self) -> str:
+        row0, col0, row1, col1 = self.bounds
+        return f"{cell_name(row0, col0)}:{cell_name(row1, col1)}"
+
+    def reduce(self, fn: Callable):
+        "reduces the values of the range, directly against the storage if possible"
+        variables = self.variables
+        if hasattr(variables, "reduce_range"):
+            return variables.reduce_range(self, fn)
+        if hasattr(variables, "range_values"):
+            return fn(iter(variables.range_values(self)))
+        return fn(map(variables.get, range_cells(self.bounds)))
+
+
+@lru_cache(maxsize=4096)
+def range_cells(bounds: tuple[int, int, int, int]) -> tuple[str, ...]:
+    """names of the cells of a range, built once per bounds to read ranges from
+    mappings of cell names, like the variables of formula_resolver"""
+    return tuple(bounds_cells(bounds))
+
+
+def to_column(values: list) -> list | array:
+    "packs the values of a range in a typed array when they are all ints or floats"
+    types = set(map(type, values))
+    if types == {int}:
+        typecode = "q"
+    elif types == {float}:
+        typecode = "d"
+    else:
+        return values
+
+    try:
+        if numpy is not None:
+            return numpy.array(values, dtype=numpy.int64 if typecode == "q" else float)
+        return array(typecode, values)
+    except OverflowError:  # ints larger than 64 bits stay as python ints
+        return values
+
+
+def pack_block(kind: int, slices: list[array]) -> array:
+    "packs the column slices of a numeric grid block in a single column"
+    if numpy is not None:
+        column = numpy.concatenate([numpy.frombuffer(s, dtype=float) for s in slices])
+        return column.astype(numpy.int64) if kind == INT else column
+    column = array("d")
+    for s in slices:
+        column.extend(s)
+    return array("q", map(int, column)) if kind == INT else column
+
+
+# bound of the sums of int64 columns computed by numpy, which wrap around silently
+MAX_INT_SUM = 2**62
+
+
+def reduce_column(values: list | array, fn: Callable) -> object:
+    "reduces a column, in a single vectorized call when it's a numpy array"
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        # a sum wraps around only if it's out of the int64 range, where the
+        # approximate sum in floats is too
+        if (
+            fn is sum
+            and values.dtype == numpy.int64
+            and abs(values.sum(dtype=float)) >= MAX_INT_SUM
+        ):
+            return sum(values.tolist())  # exact, in python ints
+        return getattr(values, fn.__name__)().item()
+    return fn(values)
+
+
+def aggregate(fn: Callable) -> Callable:
+    "builds a excel aggregate function that accepts both ranges and scalars"
+
+    def excel_fn(*args):
+        if len(args) == 1:  # a single range, as in SUM(A1:A10)
+            (arg,) = args
+            return fn((arg.reduce(fn) if isinstance(arg, RangeRef) else arg,))
+        return fn([arg.reduce(fn) if isinstance(arg, RangeRef) else arg for arg in args])
+
+    return excel_fn
+
+
+def range_operator(a: str, b: str, variables: dict) -> RangeRef:
+    return RangeRef(range_bounds(a, b), variables)
+
+
+Function = namedtuple(
+    "Function",
+    ["fn", "min_args", "max_args", "pure", "needs_refs", "vectorizable", "lazy"],
+    defaults=(True, False, False, False),
+)
+Function.__doc__ = """implementation of a excel function or operator and its metadata
+
+min_args, max_args: accepted number of arguments, max_args is None when variadic
+pure: the result only depends on the values of the arguments
+needs_refs: takes the cell names of its arguments and the variables, not values
+vectorizable: reduces its range arguments in a single call on their columns
+lazy: takes the variables, the memo of the call and its arguments unevaluated,
+    as functions of both, and only evaluates the ones it needs"""
+
+VARIADIC = None
+
+# errors caught by IFERROR, the python equivalents of #DIV/0!, #VALUE!, #NUM!
+CELL_ERRORS = (ArithmeticError, ValueError, TypeError)
+
+
+def excel_if(variables, memo, condition, if_true, if_false=None):
+    if condition(variables, memo):
+        return if_true(variables, memo)
+    return if_false(variables, memo) if if_false is not None else False
+
+
+def excel_and(variables, memo, *args):
+    return all(arg(variables, memo) for arg in args)
+
+
+def excel_or(variables, memo, *args):
+    return any(arg(variables, memo) for arg in args)
+
+
+def excel_iferror(variables, memo, value, value_if_error):
+    try:
+        return value(variables, memo)
+    except CELL_ERRORS:
+        return value_if_error(variables, memo)
+
+
+def excel_choose(variables, memo, index, *values):
+    index = int(index(variables, memo))
+    if not 1 <= index <= len(values):
+        raise ValueError(f"CHOOSE index out of range: {index}")
+    return values[index - 1](variables, memo)
+
+
+FUNCTIONS: dict[str, Function] = {
     # logical functions
-    "AND": lambda *args: all(args),
-    "OR": lambda *args: any(args),
-    "XOR": operator.xor,
-    "IF": lambda a, b, c: b if a else c,
-    "NOT": lambda a: not a,
+    "AND": Function(excel_and, 1, VARIADIC, lazy=True),
+    "OR": Function(excel_or, 1, VARIADIC, lazy=True),
+    "XOR": Function(operator.xor, 2, 2),
+    "IF": Function(excel_if, 2, 3, lazy=True),
+    "IFERROR": Function(excel_iferror, 2, 2, lazy=True),
+    "CHOOSE": Function(excel_choose, 2, VARIADIC, lazy=True),
+    "NOT": Function(lambda a: not a, 1, 1),
     # operators
-    "+": operator.add,
-    "-": operator.sub,
-    "unary -": lambda a: -1 * a,
-    "unary +": lambda a: +1 * a,
-    "*": operator.mul,
-    "/": operator.truediv,
-    "^": operator.pow,
-    "%": lambda a: a / 100,
-    "&": lambda a, b: "".join((a, b)),
-    ":": range_operator,
+    "+": Function(operator.add, 2, 2),
+    "-": Function(operator.sub, 2, 2),
+    "unary -": Function(lambda a: -1 * a, 1, 1),
+    "unary +": Function(lambda a: +1 * a, 1, 1),
+    "*": Function(operator.mul, 2, 2),
+    "/": Function(operator.truediv, 2, 2),
+    "^": Function(operator.pow, 2, 2),
+    "%": Function(lambda a: a / 100, 1, 1),
+    "&": Function(lambda a, b: "".join((a, b)), 2, 2),
+    ":": Function(range_operator, 2, 2, pure=False, needs_refs=True),
     # math functions
-    "ABS": abs,
-    "COS": math.cos,
-    "SIN": math.sin,
-    "TAN": math.tan,
-    "EXP": math.exp,
-    "LOG": math.log,
-    "LOG10": math.log10,
-    "PI": lambda: math.pi,
-    "CEIL": math.ceil,
-    "FLOOR": math.floor,
-    "MAX": max,
-    "MIN": min,
-    "ROUND": round,
-    "SUM": sum,
+    "ABS": Function(abs, 1, 1),
+    "COS": Function(math.cos, 1, 1),
+    "SIN": Function(math.sin, 1, 1),
+    "TAN": Function(math.tan, 1, 1),
+    "EXP": Function(math.exp, 1, 1),
+    "LOG": Function(math.log, 1, 2),
+    "LOG10": Function(math.log10, 1, 1),
+    "PI": Function(lambda: math.pi, 0, 0),
+    "CEIL": Function(math.ceil, 1, 1),
+    "FLOOR": Function(math.floor, 1, 1),
+    "MAX": Function(max, 1, VARIADIC, vectorizable=True),
+    "MIN": Function(min, 1, VARIADIC, vectorizable=True),
+    "ROUND": Function(round, 1, 2),
+    "SUM": Function(sum, 1, VARIADIC, vectorizable=True),
     # logical operators
-    "=": operator.eq,
-    "<>": operator.ne,
-    "<=": operator.le,
-    ">=": operator.ge,
-    ">": operator.gt,
-    "<": operator.lt,
+    "=": Function(operator.eq, 2, 2),
+    "<>": Function(operator.ne, 2, 2),
+    "<=": Function(operator.le, 2, 2),
+    ">=": Function(operator.ge, 2, 2),
+    ">": Function(operator.gt, 2, 2),
+    "<": Function(operator.lt, 2, 2),
 }
+# vectorizable functions are reductions, given their scalar arguments and the
+# reduction of each range argument against the storage of the variables
+for name, function in FUNCTIONS.items():
+    if function.vectorizable:
+        FUNCTIONS[name] = function._replace(fn=aggregate(function.fn))
+
+
+def resolve_function(node: FunctionNode) -> Function:
+    "looks up the implementation of a function node and checks its arguments"
+    try:
+        function = FUNCTIONS[node.value]
+    except KeyError:
+        raise SyntaxError(f"Unknown function: {node.value}") from None
+    n_args = len(node.children)
+    if n_args < function.min_args or (
+        function.max_args is not VARIADIC and n_args > function.max_args
+    ):
+        raise SyntaxError(f"Wrong number of arguments for {node.value}: {n_args}")
+    if function.needs_refs and not all(
+        isinstance(child, VariableNode) for child in node.children
+    ):
+        raise SyntaxError(f"{node.value} only accepts cell references")
+    return function
+
+
+def bind_functions(ast: ASTNode | None) -> ASTNode | None:
+    "resolves the function of every node of a AST once, when it's parsed"
+    stack = [ast] if ast is not None else []
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FunctionNode):
+            node.function = resolve_function(node)
+        stack.extend(node.children)
+    return ast
+
 
+def bound_function(node: FunctionNode) -> Function:
+    "the function of a node, resolved on first use in a AST that wasn't bound"
+    if node.function is None:
+        node.function = resolve_function(node)
+    return node.function
 
-def interpreter(node: ASTNode, variables: dict) -> ASTNode:
+
+def binary(node: ASTNode) -> bool:
+    "a function node of two evaluated arguments, like the operators"
+    if not isinstance(node, FunctionNode) or len(node.children) != 2:
+        return False
+    function = bound_function(node)
+    return not function.lazy and not function.needs_refs
+
+
+def left_chain(
+    node: ASTNode, shared: Container[ASTNode] = ()
+) -> tuple[ASTNode, list[FunctionNode]]:
+    """the first operand and the nodes of a chain of binary operators nested by
+    their left operand, from the innermost one. a formula of n terms like
+    1 + 2 - 3 * 4 is a chain of n - 1 operators evaluated in a loop, nesting
+    closures or calls as deep as the chain would reach the recursion limit"""
+    nodes = [node]
+    while True:
+        left = nodes[-1].children[0]
+        while isinstance(left, ParenthesesNode):
+            left = left.children[0]
+        if not binary(left) or left in shared:
+            return left, nodes[::-1]
+        nodes.append(left)
+
+
+def interpreter(node: ASTNode, variables: dict) -> ConstantNode:
+    "evaluates the AST without rewriting it, so a parsed formula can be reused"
+    while isinstance(node, ParenthesesNode):
+        node = node.children[0]
+    if isinstance(node, FunctionNode):
+        bound_function(node)
     match node:
-        case ConstantNode(value=value):
+        case ConstantNode():
             return node
         case VariableNode(value=value):
-            var_value = variables[value]
-            return ConstantNode(Token("constant", var_value))
-        case ParenthesesNode(children=children):
-            return children[0]
-        case FunctionNode(value=value, children=children) if node.end_node():
-            fn = OPERATIONS[value]
-            if need_refs(value):
-                result = fn(*(c.value for c in children), variables=variables)
-            else:
-                result = fn(*(c.value for c in children))
+            return ConstantNode(Token("constant", variables[value]))
+        case FunctionNode(function=function, children=children) if function.needs_refs:
+            result = function.fn(*(c.value for c in children), variables=variables)
             return ConstantNode(Token("constant", result))
-        case ASTNode(children=children):
-            node.children = [interpreter(child, variables) for child in children]
-            return interpreter(node, variables)
+        case FunctionNode(function=function, children=children) if function.lazy:
+            args = [partial(evaluate_value, child) for child in children]
+            result = function.fn(variables, None, *args)
+            return ConstantNode(Token("constant", result))
+        case FunctionNode() if binary(node):
+            first, chain = left_chain(node)
+            result = evaluate_value(first, variables)
+            for link in chain:
+                result = link.function.fn(result, evaluate_value(link[1], variables))
+            return ConstantNode(Token("constant", result))
+        case FunctionNode(function=function, children=children):
+            fn = function.fn
+            result = fn(*(interpreter(c, variables).value for c in children))
+            return ConstantNode(Token("constant", result))
+
+
+def evaluate_value(node: ASTNode, variables: dict, memo: dict | None = None):
+    return interpreter(node, variables).value
 
 
-def need_refs(function: str) -> bool:
-    return function in (":")
+def compile_ast(
+    node: ASTNode, wrap: Callable | None = None
+) -> Callable[[dict], object]:
+    """compiles the AST into nested closures that take the variables and return a
+    value, subtrees shared by the optimizer are evaluated once per call. the
+    implementation of each function node is passed through wrap(node, fn) if
+    given, it's called once its arguments are evaluated so it adds no nesting.
+    the tree is compiled from its leaves up without recursion"""
+    shared = shared_subtrees(node)
+    chains: dict[int, tuple[ASTNode, list[FunctionNode]]] = {}
+
+    def operands(node: ASTNode) -> Sequence[ASTNode]:
+        "the nodes compiled before a node, its children or the operands of a chain"
+        if not binary(node):
+            return node.children
+        if (key := id(node)) not in chains:
+            chains[key] = left_chain(node, shared)
+        first, chain = chains[key]
+        return [first, *(link[1] for link in chain)]
+
+    def compile_one(node: ASTNode, args: list[Callable]) -> Callable:
+        if binary(node):
+            evaluate = compile_chain(chains[id(node)][1], args, wrap)
+        else:
+            evaluate = compile_node(node, args, wrap)
+        if node not in shared:
+            return evaluate
+        key = id(node)
+
+        def evaluate_once(variables, memo):
+            if key not in memo:
+                memo[key] = evaluate(variables, memo)
+            return memo[key]
+
+        return evaluate_once
+
+    evaluate = bottom_up(node, compile_one, operands)
+    if not shared:
+        return partial(evaluate, memo=None)
+
+    # the values of the shared subtrees are kept in a memo created by each call
+    # and passed down, a formula can be evaluated by several threads at once and
+    # again while it's evaluated, for another cell
+    def evaluate_formula(variables):
+        return evaluate(variables, {})
+
+    return evaluate_formula
+
+
+def compile_node(
+    node: ASTNode, args: list[Callable], wrap: Callable | None = None
+) -> Callable[[dict, dict | None], object]:
+    """compiles a single node into a closure of the variables and the memo of the
+    shared subtrees, args are the compiled children of the node"""
+    match node:
+        case ConstantNode(value=value):
+            return lambda variables, memo: value
+        case VariableNode(value=value):
+            return lambda variables, memo: variables[value]
+        case ParenthesesNode():
+            return args[0]
+        # the bounds of a range are resolved once, at compile time
+        case FunctionNode(
+            value=":", children=[VariableNode(value=start), VariableNode(value=stop)]
+        ):
+            bounds = range_bounds(start, stop)
+            ref = RangeRef if wrap is None else wrap(node, RangeRef)
+            return lambda variables, memo: ref(bounds, variables)
+
+    function = bound_function(node)
+    fn = function.fn if wrap is None else wrap(node, function.fn)
+    if function.needs_refs:
+        refs = tuple(c.value for c in node.children)
+        return lambda variables, memo: fn(*refs, variables=variables)
+    # the arguments are passed compiled, to be evaluated only when needed
+    if function.lazy:
+        return lambda variables, memo: fn(variables, memo, *args)
+    # specialize the common arities to avoid building argument lists
+    match args:
+        case []:
+            return lambda variables, memo: fn()
+        case [a]:
+            return lambda variables, memo: fn(a(variables, memo))
+        case _:
+            return lambda variables, memo: fn(*[arg(variables, memo) for arg in args])
+
+
+def compile_chain(
+    chain: list[FunctionNode], args: list[Callable], wrap: Callable | None = None
+) -> Callable[[dict, dict | None], object]:
+    "compiles a chain of binary operators, args are its compiled operands"
+    fns = [link.function.fn for link in chain]
+    if wrap is not None:
+        fns = [wrap(link, fn) for link, fn in zip(chain, fns)]
+    if len(chain) == 1:
+        (fn,), (a, b) = fns, args
+        return lambda variables, memo: fn(a(variables, memo), b(variables, memo))
+
+    first, links = args[0], list(zip(fns, args[1:]))
+
+    def evaluate_chain(variables, memo):
+        value = first(variables, memo)
+        for fn, arg in links:
+            value = fn(value, arg(variables, memo))
+        return value
+
+    return evaluate_chain
+
+
+FORMULA_CACHE_SIZE = 4096
+BATCH_SIZE = 4096  # formulas sent to a worker at a time by formula_resolver_many
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def parse_formula(expr: str) -> ASTNode:
+    "lex and parse a formula, cells sharing the same formula text share one AST"
+    return optimize(bind_functions(parser(lexer(expr))))
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_formula(expr: str) -> Callable[[dict], object]:
+    "parse and compile a formula into a callable, cached by the formula text"
+    return compile_ast(parse_formula(expr))
 
 
 def formula_resolver(expr: str, variables: dict | None = None):
     if variables is None:
         variables = {}
-    tokens = lexer(expr)
-    ast = parser(tokens)
-    # print(ast)
-    result = interpreter(ast, variables)
-    return result.value
+    return compile_formula(expr)(variables)
+
+
+def formula_resolver_many(
+    formulas: str | Iterable[tuple[str, dict | None]],
+    bindings: Iterable[dict] = (),
+    jobs: int = 1,
+) -> Iterator:
+    """evaluates many (expression, variables) pairs, or one expression against
+    many variables, yielding the results in order. each distinct expression is
+    compiled once, with jobs > 1 batches are evaluated on a process pool"""
+    if isinstance(formulas, str):
+        if jobs <= 1:
+            evaluate = compile_formula(formulas)
+            return (evaluate({} if v is None else v) for v in bindings)
+        formulas = zip(repeat(formulas), bindings)
+    if jobs <= 1:
+        return resolve_pairs(formulas)
+    return resolve_parallel(formulas, jobs)
+
+
+def resolve_pairs(formulas: Iterable[tuple[str, dict | None]]) -> Iterator:
+    compiled: dict[str, Callable] = {}  # not bounded by the size of the lru cache
+    empty: dict = {}
+    for expr, variables in formulas:
+        if (evaluate := compiled.get(expr)) is None:
+            evaluate = compiled[expr] = compile_formula(expr)
+        yield evaluate(empty if variables is None else variables)
+
+
+def resolve_batch(formulas: list[tuple[str, dict | None]]) -> list:
+    "evaluates a batch of formulas in a worker process"
+    return list(resolve_pairs(formulas))
+
+
+def resolve_parallel(formulas: Iterable[tuple[str, dict | None]], jobs: int):
+    formulas = iter(formulas)
+    batches = iter(lambda: list(islice(formulas, BATCH_SIZE)), [])
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for results in executor.map(resolve_batch, batches):
+            yield from results
 
 
 if __name__ == "__main__":
@@ -9,7 +9,9 @@ class SyntaxError(Exception):
 
 FUNCTIONS_LOGICAL = (
     "AND",
+    "CHOOSE",
     "IF",
+    "IFERROR",
     "NOT",
     "OR",
     "XOR",
@@ -56,63 +58,95 @@ SYMBOLS = (
 
 
 # VARIABLES
-RE_CELL_REF = re.compile(r"\$?[A-Z]+\$?[0-9]+").match
+RE_CELL_REF = r"\$?[A-Z]+\$?[0-9]+"
 # DATE TYPES
-RE_BOOL = re.compile("TRUE|FALSE").match
-RE_STRING = re.compile(r"\".*?\"").match
-RE_INT = re.compile(r"[0-9]+").match
-RE_FLOAT = re.compile(r"[0-9]+\.[0-9]+").match
-RE_FLOAT_SCIENTIFIC = re.compile(r"[0-9]+(e|E)[\+\-]?[0-9]+").match
+RE_BOOL = r"TRUE|FALSE"
+RE_STRING = r"\".*?\""
+RE_INT = r"[0-9]+"
+RE_FLOAT = r"[0-9]+\.[0-9]+"
+RE_FLOAT_SCIENTIFIC = r"[0-9]+(?:e|E)[\+\-]?[0-9]+"
 
 # SPECIAL CHARACTERS
-RE_SYMBOLS = re.compile(r"|".join(SYMBOLS)).match
-RE_SPACE = re.compile(r"\s+").match
+RE_SYMBOLS = r"|".join(SYMBOLS)
+RE_SPACE = r"\s+"
 
 # FUNCTIONS AND OPERATORS
-RE_OPERATOR = re.compile(r"|".join(LOGICAL_OPERATORS + OPERATORS)).match
-RE_FUNCTION = re.compile(r"|".join(FUNCTIONS_MATH + FUNCTIONS_LOGICAL)).match
+RE_OPERATOR = r"|".join(LOGICAL_OPERATORS + OPERATORS)
+# longest names first, so LOG10 isn't lexed as LOG followed by 10. names followed
+# by letters or digits are cells of columns like IF or SUM (IF1, SUM$2, SUMA3)
+RE_FUNCTION = (
+    r"(?:"
+    + r"|".join(sorted(FUNCTIONS_MATH + FUNCTIONS_LOGICAL, key=len)[::-1])
+    + r")(?![A-Z0-9$])"
+)
+
+# master regex, alternatives are tried in order so the first one wins
+RE_TOKEN = re.compile(
+    r"|".join(
+        f"(?P<{name}>{pattern})"
+        for name, pattern in (
+            ("space", RE_SPACE),
+            ("symbol", RE_SYMBOLS),
+            ("operator", RE_OPERATOR),
+            ("function", RE_FUNCTION),
+            ("variable", RE_CELL_REF),
+            ("bool", RE_BOOL),
+            ("string", RE_STRING),
+            ("float", RE_FLOAT),
+            ("float_scientific", RE_FLOAT_SCIENTIFIC),
+            ("int", RE_INT),
+        )
+    )
+)
 
 Token = namedtuple("Token", ["type", "value"])
 LParenthesis = Token("symbol", "(")
 RParenthesis = Token("symbol", ")")
 Comma = Token("symbol", ",")
+# the symbols, operators and functions are a small vocabulary, each one is lexed
+# into the same token object
+INTERNED: dict[str, Token] = {}
+
+
+def scan(expression: str) -> Iterator[re.Match]:
+    "matches the tokens of a raw expression one after the other, spaces included"
+    match_token = RE_TOKEN.match
+    pos, end = 0, len(expression)
+    while pos < end:
+        m = match_token(expression, pos)
+        # Unknown Token
+        if m is None:
+            raise SyntaxError(
+                f"Invalid Token in Expression at position {pos}: {expression[pos:]}"
+            )
+        pos = m.end()
+        yield m
 
 
 def lexer(expression: str) -> Iterator[Token]:
     "converts a raw expression in a list of tokens"
-    # base case
-    if expression == "":
-        return
-    # Ignore Space
-    elif m := RE_SPACE(expression):
-        pass
-    # Symbols, Operator and Functions
-    elif m := RE_SYMBOLS(expression):
-        yield Token("symbol", m.group())
-    elif m := RE_OPERATOR(expression):
-        yield Token("operator", m.group())
-    elif m := RE_FUNCTION(expression):
-        yield Token("function", m.group())
-    # Excel Variables
-    elif m := RE_CELL_REF(expression):
-        yield Token("variable", m.group())
-    # Excel Data Types
-    elif m := RE_BOOL(expression):
-        yield Token("constant", m.group() == "TRUE")
-    elif m := RE_STRING(expression):
-        yield Token("constant", m.group().replace('"', ""))
-    elif m := RE_FLOAT(expression):
-        yield Token("constant", float(m.group()))
-    elif m := RE_FLOAT_SCIENTIFIC(expression):
-        yield Token("constant", float(m.group()))
-    elif m := RE_INT(expression):
-        yield Token("constant", int(m.group()))
-    # Unknown Token
-    else:
-        raise SyntaxError(f"Invalid Token in Expression: {expression}")
-
-    expression = expression.removeprefix(m.group())
-    yield from lexer(expression)
+    for m in scan(expression):
+        match m.lastgroup:
+            # Ignore Space
+            case "space":
+                continue
+            # Symbols, Operator, Functions and Excel Variables
+            case "symbol" | "operator" | "function" as kind:
+                text = m.group()
+                if (token := INTERNED.get(text)) is None:
+                    token = INTERNED[text] = Token(kind, text)
+                yield token
+            case "variable":
+                yield Token("variable", m.group())
+            # Excel Data Types
+            case "bool":
+                yield Token("constant", m.group() == "TRUE")
+            case "string":
+                yield Token("constant", m.group().replace('"', ""))
+            case "float" | "float_scientific":
+                yield Token("constant", float(m.group()))
+            case "int":
+                yield Token("constant", int(m.group()))
 
 
 def get_precedence(token: Token) -> int:
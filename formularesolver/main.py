@@ -1,67 +1,74 @@
+import argparse
 import cmd
 import csv
 import sys
-from collections import UserDict
 from pathlib import Path
 from typing import Generator
 
-from interpreter import formula_resolver
-from utils import alphabetical_generator, arange
+from grid import Grid
+from profiler import Profiler
+from rangeindex import RangeIndex
+from sheet import Variables, get_bounds
+from snapshot import (changed_cells, file_digest, read_snapshot,
+                      restore_snapshot, save_snapshot, snapshot_digest)
+from stream import STREAM_WINDOW, scan_csv, stream_csv
+from utils import cell_index, cell_name
 
+# share of the formulas that can change before a snapshot isn't worth restoring
+MAX_CHANGED = 0.25
 
-class Variables(UserDict):
-    "evaluate a cell variable when getitem is called"
 
-    def __getitem__(self, key):
-        cell = super().__getitem__(key)
-        cell = cell.lstrip("=")
-        return formula_resolver(cell, variables=self) if cell else ""
-
-    def __missing__(self, key):
-        return ""
-
-    def __repr__(self) -> str:
-        cells = [list(line) for line in get_bounds(self)]
-
-        # gen header with col names from the first line
-        header = ["|      |"]
-        for cell in cells[0]:
-            cell = "".join(c for c in cell if not c.isnumeric())  # remove numbers
-            header.append(f"{cell:^6}|")
-        header.append("\n")
-
-        # construct and add table divisor / spacer
-        len_header = len("".join(header)) - 1
-        div = "-" * len_header + "\n"
-        repr = [div] + header + [div]
+def csv2grid(filename: str) -> Grid:
+    "parse a CSV file into a grid of raw cells"
+    grid = Grid()
+    with open(filename) as csv_file:
+        reader = csv.reader(csv_file)
+        for row_num, row in enumerate(reader):
+            for col_num, cell in enumerate(row):
+                grid[row_num, col_num] = cell.strip()
+    return grid
 
-        # iter all cells and add then to the table representation
-        for line in cells:
-            # add line number
-            n = "".join(c for c in line[0] if c.isnumeric())  # remove letters
-            repr.append(f"|{n:^6}|")
-            # add cells
-            for cell in line:
-                repr.append(f"{self[cell]:>6}|")
-            repr.append("\n")
 
-        repr.append(div)
-        return "".join(repr)
+def grid2variables(grid: Grid) -> Variables:
+    variables = Variables()
+    variables.grid = grid
+    variables.share_formulas()
+    return variables
 
 
 def csv2variables(filename: str) -> Variables:
     "parse a CSV file into a Variables dict"
+    return grid2variables(csv2grid(filename))
+
+
+def cached_csv2variables(filename: str, digest: bytes) -> Variables:
+    """parse a CSV file, restoring the values saved in its snapshot. the cells
+    changed since then are set one by one, only their dependents are recomputed"""
+    snapshot = read_snapshot(filename)
+    if snapshot is None:
+        return csv2variables(filename)
     variables = Variables()
-    with open(filename) as csv_file:
-        reader = csv.reader(csv_file)
-        for line_num, row in enumerate(reader, 1):
-            for col_char, cell in zip(alphabetical_generator(), row):
-                variables[col_char + str(line_num)] = cell.strip()
+    if snapshot.digest == digest:
+        restore_snapshot(variables, snapshot)  # the csv doesn't need to be parsed
+        return variables
+
+    grid = csv2grid(filename)
+    changed = changed_cells(snapshot.grid, grid)
+    if len(changed) > len(grid.texts) * MAX_CHANGED:
+        return grid2variables(grid)  # recomputing the whole sheet is cheaper
+    restore_snapshot(variables, snapshot)
+    try:
+        for row, col in changed:
+            variables.set(cell_name(row, col), grid[row, col])
+    except Exception:
+        return grid2variables(grid)  # raised again when the sheet is evaluated
+    variables.grid = grid  # same cells, but the shape of the new csv
     return variables
 
 
-def variables2csv(variables: Variables) -> Generator:
+def variables2csv(variables: Variables, jobs: int = 1) -> Generator:
     "evaluates the cell variables and format then into a csv"
+    variables.recalculate(jobs=jobs)
     lines = get_bounds(variables)
     first = True
     for line in lines:
@@ -75,16 +82,6 @@ def variables2csv(variables: Variables) -> Generator:
         first = True
 
 
-def get_bounds(variables: Variables) -> Generator:
-    "returns a list of excel cells where the indices are the csv positions"
-    only_nums = lambda s: int("".join(c for c in s if c.isnumeric()))
-    only_chars = lambda s: "".join(c for c in s if not c.isnumeric())
-    max_line = max(map(only_nums, variables.keys()))
-    max_col = max(map(only_chars, variables.keys()), key=lambda s: (len(s), s))
-
-    return ((c + str(j) for c in arange("A", max_col)) for j in range(1, max_line + 1))
-
-
 class PyParseExcelShell(cmd.Cmd):
     intro = "Welcome to the PyParseExcel shell.\nType help or ? to list commands.\n"
     prompt = "(sheet) "
@@ -97,15 +94,25 @@ class PyParseExcelShell(cmd.Cmd):
     def do_set(self, arg: str) -> None:
         "attribute a value to a given cell in the sheet\n\t$ set [cell] [formula / value]"
         cell, formula, *_ = arg.split(maxsplit=1)
-        self.variables[cell] = formula
+        changed = self.variables.set(cell, formula) - {cell.replace("$", "")}
         print(f">>> {cell} = {self.variables[cell]}")
+        if changed:
+            print(f">>> updated: {', '.join(sorted(changed, key=cell_index))}")
 
     def do_get(self, arg: str) -> None:
         "print the value of a cell to the terminal\n\t$ get [cell]"
         cell, *_ = arg.split()
-        formula = self.variables.__dict__["data"].get(cell)
+        formula = self.variables.raw(cell)
         print(f">>> {cell} = {self.variables[cell]}  (formula: {formula!r})")
 
+    def do_stats(self, arg: str) -> None:
+        "print the cells that took the longest to evaluate\n\t$ stats [number of cells]"
+        if self.variables.profiler is None:
+            self.variables.profiler = Profiler()
+            print(">>> profiling enabled, the cells evaluated from now on are recorded")
+            return
+        print(self.variables.profiler.report(int(arg) if arg.strip() else 10))
+
     def do_view(self, arg) -> None:
         "print the sheet to the terminal"
         print(self.variables)
@@ -120,32 +127,106 @@ class PyParseExcelShell(cmd.Cmd):
         return True
 
 
+def stream(filename: str) -> Generator:
+    "evaluates a csv file row by row when its formulas only look a few rows back"
+    try:
+        n_cols, back, forward = scan_csv(filename)
+    except Exception as e:
+        raise Exception(f"Could not parse CSV file: {e}")
+
+    # formulas referring to rows far away need the whole sheet in memory
+    if forward > 0 or back > STREAM_WINDOW:
+        lines = variables2csv(csv2variables(filename))
+    else:
+        lines = stream_csv(filename, n_cols, back)
+
+    # holds the last line back to strip it like the buffered output
+    try:
+        previous = next(lines, "")
+        for line in lines:
+            yield previous
+            previous = line
+        yield previous.rstrip()
+    except Exception as e:
+        raise Exception(f"Interpreter Error: {e}")
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="evaluates the cells of a csv")
+    arg_parser.add_argument("filename")
+    arg_parser.add_argument("-i", action="store_true", help="enter the REPL")
+    arg_parser.add_argument(
+        "--stream", action="store_true", help="evaluate rows as they are read"
+    )
+    arg_parser.add_argument(
+        "--jobs", type=int, default=1, help="processes used to recalculate the sheet"
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the cost of the most expensive cells to stderr",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse and update the values saved next to the csv by a previous run",
+    )
+    arg_parser.add_argument(
+        "--index",
+        action="store_true",
+        help="answer SUM, MAX and MIN over large ranges of numbers from a index",
+    )
+    args = arg_parser.parse_args()
+    if args.profile and args.stream:
+        arg_parser.error("--profile can't be used with --stream")
+    if args.cache and args.stream:
+        arg_parser.error("--cache can't be used with --stream")
+    return args
+
+
 def main() -> None:
     # argument checks
-    assert len(sys.argv) in (2, 3), ValueError(
-        "wrong number of args, must pass a filename as an argument"
-    )
-    filename, path = sys.argv[-1], Path(sys.argv[-1])
+    args = parse_args()
+    filename, path = args.filename, Path(args.filename)
     assert path.exists(), FileNotFoundError(f"file {filename} doesn't exist")
     assert path.is_file(), FileNotFoundError(f"argument {filename} is not a file")
+    assert args.jobs >= 1, ValueError("the number of jobs must be at least 1")
+
+    # on stream flag, evaluates and outputs the rows as they are read
+    if args.stream:
+        for line in stream(filename):
+            sys.stdout.write(line)
+        return
 
     # read and parse file
     try:
-        variables = csv2variables(filename)
+        if args.cache:
+            digest = file_digest(filename)
+            variables = cached_csv2variables(filename, digest)
+        else:
+            variables = csv2variables(filename)
     except Exception as e:
         raise Exception(f"Could not parse CSV file: {e}")
+    if args.profile:
+        variables.profiler = Profiler()
+    if args.index:
+        variables.range_index = RangeIndex(variables.grid)
 
     # on interactve flag, enter REPL mode
-    if "-i" in sys.argv:
+    if args.i:
         PyParseExcelShell(variables).cmdloop()
         return
 
     # evaluates cells and print to stdout
     try:
-        csv_out = "".join(variables2csv(variables))
+        csv_out = "".join(variables2csv(variables, jobs=args.jobs))
         print(csv_out.rstrip(), end="")
     except Exception as e:
         raise Exception(f"Interpreter Error: {e}")
+    if args.cache and snapshot_digest(filename) != digest:
+        save_snapshot(variables, filename, digest)
+    if args.profile:
+        print(variables.profiler.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+from collections import Counter
+from functools import partial
+from operator import attrgetter
+from parser import ASTNode, ConstantNode, FunctionNode, ParenthesesNode
+from typing import Callable, Iterator, Sequence
+
+from lexer import Token
+
+# below this size looking up the value of a subtree costs more than evaluating it
+MIN_SHARED_NODES = 4
+
+
+def optimize(ast: ASTNode | None) -> ASTNode | None:
+    "folds the constant subtrees of a AST and merges its identical subtrees"
+    if ast is None:
+        return None
+    nodes: dict = {}  # hash consing table of the optimized nodes
+
+    def optimize_node(node: ASTNode, children: list[ASTNode]) -> ASTNode:
+        return share_node(fold_node(node, children), nodes)
+
+    return bottom_up(ast, optimize_node)
+
+
+def bottom_up(
+    ast: ASTNode,
+    rebuild: Callable[[ASTNode, list], object],
+    children: Callable[[ASTNode], Sequence[ASTNode]] = attrgetter("children"),
+) -> object:
+    """rebuilds a AST from its leaves up without recursion, so deep formulas don't
+    reach the recursion limit. rebuild(node, results of its children) is called
+    once per distinct node"""
+    results: dict[int, object] = {}  # id of a node -> its result
+    stack = [(ast, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in results:
+            continue
+        if expanded:
+            results[id(node)] = rebuild(node, [results[id(c)] for c in children(node)])
+        else:
+            stack.append((node, True))  # rebuilt once its children are
+            stack.extend((child, False) for child in reversed(children(node)))
+    return results[id(ast)]
+
+
+def fold_node(node: ASTNode, children: list[ASTNode]) -> ASTNode:
+    "replaces the calls to pure functions with constant arguments by their value"
+    match node:
+        case ParenthesesNode():
+            return children[0]  # the tree already holds the precedence
+        case FunctionNode(function=function):
+            if function.pure and all(isinstance(c, ConstantNode) for c in children):
+                values = [child.value for child in children]
+                if function.lazy:
+                    values = [None, None, *(partial(constant, v) for v in values)]
+                try:
+                    value = function.fn(*values)
+                except (ArithmeticError, ValueError, TypeError):
+                    pass  # errors are raised when the formula is evaluated
+                else:
+                    return ConstantNode(Token("constant", value))
+            folded = FunctionNode(node.token, children)
+            folded.function = function
+            return folded
+        case _:
+            return node
+
+
+def constant(value, variables, memo):
+    return value
+
+
+def share_node(node: ASTNode, nodes: dict) -> ASTNode:
+    """hash conses a node whose children are hash consed, identical subtrees
+    become the same node object"""
+    # 1, 1.0 and TRUE are equal in python but are different constants, and so
+    # are 0.0 and -0.0, told apart by their repr
+    value = repr(node.value) if isinstance(node.value, float) else node.value
+    key = (type(node), type(node.value), value, *map(id, node.children))
+    return nodes.setdefault(key, node)
+
+
+def shared_subtrees(ast: ASTNode) -> set[ASTNode]:
+    "subtrees used more than once in a AST and big enough to evaluate only once"
+    uses = Counter(id(node) for node in walk_nodes(ast))
+    return {
+        node
+        for node in walk_nodes(ast)
+        if uses[id(node)] > 1 and evaluated_nodes(node) >= MIN_SHARED_NODES
+    }
+
+
+def evaluated_nodes(ast: ASTNode | None) -> int:
+    "number of nodes evaluated by a compiled formula, shared subtrees count once"
+    if ast is None:
+        return 0
+    nodes, stack = set(), [ast]
+    while stack:
+        node = stack.pop()
+        if id(node) not in nodes:
+            nodes.add(id(node))
+            stack.extend(node.children)
+    return len(nodes)
+
+
+def walk_nodes(ast: ASTNode) -> Iterator[ASTNode]:
+    "yields every node of a AST, shared nodes once per use"
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children)
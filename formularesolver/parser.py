@@ -1,20 +1,25 @@
-from itertools import chain
-from typing import Iterator, Self
+from typing import Iterator, Self, Sequence
 
-from lexer import Token
-from utils import needs_swap, parse_function_args, parse_parenthesis_expr
+from lexer import Comma, LParenthesis, RParenthesis, Token, get_precedence
 
 
 class ASTNode:
     "Abstract Syntax Tree Node"
 
-    def __init__(self, token: Token, children: list[Self] | None = None):
-        self.token = token
-        self.value = token.value
-        self.children = children if children is not None else []
+    # millions of nodes are held for the formulas of large sheets, the token is
+    # stored flat so the node doesn't keep a tuple alive
+    __slots__ = ("type", "value", "children")
 
-    def __iter__(self) -> list[Self]:
-        return self.children
+    def __init__(self, token: Token, children: Sequence[Self] = ()):
+        self.type, self.value = token
+        self.children = tuple(children)  # leaves share the empty tuple
+
+    @property
+    def token(self) -> Token:
+        return Token(self.type, self.value)
+
+    def __iter__(self) -> Iterator[Self]:
+        return iter(self.children)
 
     def __getitem__(self, key: int) -> Self:
         return self.children[key]
@@ -37,7 +42,7 @@ class ASTNode:
         return all(node.childless() for node in self.children)
 
     def childless(self) -> bool:
-        return not isinstance(self, FunctionNode) and self.children == []
+        return not isinstance(self, FunctionNode) and not self.children
 
     def walk(self) -> Iterator[Token]:
         yield self.token
@@ -46,114 +51,156 @@ class ASTNode:
 
 
 class VariableNode(ASTNode):
-    pass
+    __slots__ = ()
 
 
 class ConstantNode(ASTNode):
-    pass
+    __slots__ = ()
 
 
 class FunctionNode(ASTNode):
-    pass
+    __slots__ = ("function",)
+
+    def __init__(self, token: Token, children: Sequence[ASTNode] = ()):
+        super().__init__(token, children)
+        self.function = None  # implementation bound by the interpreter when parsed
 
 
 class ParenthesesNode(ASTNode):
-    pass
-
-
-def parser(tokens: Iterator[Token], parent=None) -> ASTNode:
-    "consume a list of token to assemble a AST"
-
-    # clean up some call of iter() from the code
-    if isinstance(tokens, list):
-        tokens = iter(tokens)
-
-    try:
-        token = next(tokens)
-    except StopIteration:
-        return parent  # base case
-
-    match token:
-        case Token("variable"):
-            node = VariableNode(token)
-            return parser(tokens, node)
-
-        case Token("constant"):
-            node = ConstantNode(token)
-            return parser(tokens, node)
-
-        case Token("function"):
-            args = parse_function_args(tokens)
-            args = filter(None, (parser(iter(arg)) for arg in args))
-            node = FunctionNode(token, list(args))
-            return parser(tokens, node)
-
-        # handles parenthesis precedence
-        case Token("symbol", "("):
-            expr = parse_parenthesis_expr(chain([token], tokens))
-            node = ParenthesesNode(token, [parser(iter(expr), parent)])
-            return parser(tokens, node)
-
-        # handles right associative unary operator (%)
-        case Token("operator", "%") if parent is not None:
-            node = FunctionNode(token, [parent])
-            return parser(tokens, node)
-
-        # handles left associative unary operators
-        case Token("operator", "+" | "-") if parent is None:
-            peek = next(tokens)
-            token = Token("operator", f"unary {token.value}")
-            # unary left operator only allowed when:
-            # - operator plus and minus
-            # - start of expression or parser called from the operator case
-            # - next token is a variable, constant or parenthesis expression
-            match peek:
-                case Token("variable"):
-                    node = FunctionNode(token, [VariableNode(peek)])
-                case Token("constant"):
-                    node = FunctionNode(token, [ConstantNode(peek)])
-                case Token("symbol", "("):
-                    tokens = chain([peek], tokens)  # re-insert left parenthesis
-                    node = FunctionNode(token, [parser(tokens)])
-                case _:
-                    raise SyntaxError(f"Invalid unary expression for token: {token}")
-            return parser(tokens, node)
-
-        # handles binary operators
-        case Token("operator") if parent is not None:
-            left = parent
-            right = parser(tokens)
-
-            # receives parent = none when a operator case call parser(tokens) or when operator in the beginning of a expression
-            # receives left_operand = none when expression ends in a operator
-            if left is None or right is None:
+    __slots__ = ()
+
+
+def references(node: ASTNode) -> Iterator[tuple[str, str]]:
+    "yields the (start, stop) cells of every range and variable used in a AST"
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        match node:
+            case FunctionNode(
+                value=":",
+                children=[VariableNode(value=start), VariableNode(value=stop)],
+            ):
+                yield start, stop
+            case VariableNode(value=value):
+                yield value, value
+            case ASTNode(children=children):
+                stack.extend(reversed(children))
+
+
+MINUS = Token("operator", "unary -")
+PLUS = Token("operator", "+")
+PERCENT = Token("operator", "%")
+UNARY = {"+": Token("operator", "unary +"), "-": MINUS}
+
+
+def reduce_operator(token: Token, operands: list[ASTNode]) -> None:
+    "pops the operands of a unary or binary operator and pushes the new node"
+    if token.value.startswith("unary"):
+        operands.append(FunctionNode(token, [operands.pop()]))
+        return
+
+    right, left = operands.pop(), operands.pop()
+    # hacky way to handle minus sign, transforms '2 - 1' into '2 + (-1)'
+    if token.value == "-":
+        right, token = FunctionNode(MINUS, [right]), PLUS
+    operands.append(FunctionNode(token, [left, right]))
+
+
+def reduce_stack(operators: list[Token], operands: list[ASTNode], precedence: int):
+    "reduces the operators on top of the stack with a precedence >= the given one"
+    while (
+        operators
+        and operators[-1].type == "operator"
+        and get_precedence(operators[-1]) >= precedence
+    ):
+        reduce_operator(operators.pop(), operands)
+
+
+def parser(tokens: Iterator[Token]) -> ASTNode | None:
+    "consume a list of token to assemble a AST (precedence climbing, no recursion)"
+    operands: list[ASTNode] = []
+    # pending operators, function tokens and open parenthesis
+    operators: list[Token] = []
+    # number of complete arguments for each open parenthesis
+    arg_counts: list[int] = []
+    last: Token | None = None
+    expect_operand = True
+
+    for token in tokens:
+        if last is not None and last.type == "function" and token != LParenthesis:
+            raise SyntaxError(f"Expected parenthesis after function: {last}")
+        # ',' and ')' can't close a expression that ends in a operator
+        if token in (Comma, RParenthesis) and expect_operand and last is not None:
+            if last.type == "operator":
+                raise SyntaxError(f"Invalid right side operand: {last}")
+
+        match token:
+            case Token("variable" | "constant") if expect_operand:
+                node_type = VariableNode if token.type == "variable" else ConstantNode
+                operands.append(node_type(token))
+                expect_operand = False
+
+            case Token("function") if expect_operand:
+                operators.append(token)
+
+            case Token("symbol", "(") if expect_operand:
+                operators.append(token)
+                arg_counts.append(0)
+
+            case Token("symbol", ","):
+                reduce_stack(operators, operands, 0)
+                if len(operators) < 2 or operators[-2].type != "function":
+                    raise SyntaxError(f"Invalid token outside of function: {token}")
+                if not expect_operand:  # empty arguments are ignored
+                    arg_counts[-1] += 1
+                expect_operand = True
+
+            case Token("symbol", ")"):
+                reduce_stack(operators, operands, 0)
+                if not operators or operators[-1] != LParenthesis:
+                    raise SyntaxError("Unmatched Parenthesis")
+                operators.pop()
+                n_args = arg_counts.pop() + (not expect_operand)
+
+                if operators and operators[-1].type == "function":
+                    args = operands[len(operands) - n_args :]
+                    del operands[len(operands) - n_args :]
+                    operands.append(FunctionNode(operators.pop(), args))
+                elif n_args == 1:
+                    operands.append(ParenthesesNode(LParenthesis, [operands.pop()]))
+                else:
+                    raise SyntaxError("Empty Parenthesis")
+                expect_operand = False
+
+            # handles right associative unary operator (%)
+            case Token("operator", "%") if not expect_operand:
+                reduce_stack(operators, operands, get_precedence(token) + 1)
+                operands.append(FunctionNode(token, [operands.pop()]))
+
+            # handles left associative unary operators
+            case Token("operator", "+" | "-") if expect_operand:
+                operators.append(UNARY[token.value])
+
+            # handles binary operators (left associative)
+            case Token("operator") if not expect_operand:
+                reduce_stack(operators, operands, get_precedence(token))
+                operators.append(token)
+                expect_operand = True
+
+            case Token("operator"):
                 raise SyntaxError(f"Invalid right side operand: {token}")
 
-            # hacky way to handle minus sign, transforms '2 - 1' into '2 + (-1)'
-            # if right operand is a FunctionNode, applies unary - to the first children
-            MINUS = Token("operator", "unary -")
-            if token.value == "-" and isinstance(right, FunctionNode):
-                sub_node = FunctionNode(MINUS, [right.children.pop(0)])
-                right.children.insert(0, sub_node)
-                token = Token("operator", "+")
-            elif token.value == "-":
-                right = FunctionNode(MINUS, [right])
-                token = Token("operator", "+")
-
-            # invert nodes if right priority > left priority
-            if needs_swap(token, right.token):
-                node = FunctionNode(token, [left, right.children.pop(0)])
-                # need to check if token has priority over next children too
-                # e.g. -> 1 ^ 2 * 3 + 4
-                if needs_swap(token, node[1].token):
-                    subnode = node.children.pop()
-                    node.children.append(subnode.children.pop(0))
-                    subnode.children.append(node)
-                    node = subnode
-                right.children.insert(0, node)
-                return right
-
-            return FunctionNode(token, [left, right])
-
-        case _:
-            raise SyntaxError(f"Invalid token: {token}")
+            case _:
+                raise SyntaxError(f"Invalid token: {token}")
+
+        last = token
+
+    if last is None:
+        return None  # empty expression
+    if expect_operand:
+        raise SyntaxError(f"Invalid right side operand: {last}")
+
+    reduce_stack(operators, operands, 0)
+    if operators:
+        raise SyntaxError("Unmatched Parenthesis")
+    return operands[0]
@@ -0,0 +1,112 @@
+from collections import Counter, namedtuple
+from parser import ASTNode, parser
+from time import perf_counter
+from typing import Callable
+
+from interpreter import bind_functions, compile_ast
+from lexer import lexer
+from optimizer import optimize
+from shared import SharedView
+
+# seconds spent on each step of the evaluation of a cell, eval excludes the time
+# spent evaluating the cells it reads. cells sharing the parsed formula of
+# another cell show their own formula, marked as shared
+CellProfile = namedtuple("CellProfile", ["formula", "lex", "parse", "compile", "eval"])
+
+
+class Profiler:
+    """opt in instrumentation of the evaluation of a sheet, set as the profiler of
+    a Variables sheet to record the cost of each cell it evaluates"""
+
+    def __init__(self) -> None:
+        self.cells: dict[str, CellProfile] = {}
+        self.depths: dict = {}  # key -> length of the longest chain of precedents
+        self.calls: Counter[str] = Counter()  # function -> number of calls
+        self.formulas: dict[str, Callable] = {}  # compiled formulas, by their text
+        self.formula_hits = self.formula_misses = 0
+        self.cache_hits = self.cache_misses = 0
+        self.nested: list[float] = []  # time of the cells read by the ones evaluating
+
+    def compile(self, formula: str) -> tuple[Callable, float, float, float]:
+        "compiled formula and the time spent lexing, parsing and compiling it"
+        if (evaluate := self.formulas.get(formula)) is not None:
+            self.formula_hits += 1
+            return evaluate, 0.0, 0.0, 0.0
+
+        self.formula_misses += 1
+        start = perf_counter()
+        tokens = list(lexer(formula))
+        lexed = perf_counter()
+        ast = optimize(bind_functions(parser(tokens)))
+        parsed = perf_counter()
+        evaluate = self.formulas[formula] = compile_ast(ast, wrap=self.count_calls)
+        return evaluate, lexed - start, parsed - lexed, perf_counter() - parsed
+
+    def count_calls(self, node: ASTNode, fn: Callable) -> Callable:
+        "wraps the implementation of a function node to count its calls"
+        calls, name = self.calls, node.value
+
+        def counted(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+
+        return counted
+
+    def resolve(self, key: str, formula: str, variables):
+        "evaluates the formula of a cell, recording the time spent on each step"
+        evaluate, lex, parse, compile = self.compile(formula)
+        self.nested.append(0.0)
+        start = perf_counter()
+        try:
+            return evaluate(variables)
+        finally:
+            elapsed = perf_counter() - start
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed + lex + parse + compile
+            if isinstance(variables, SharedView):
+                # the formula of the group is the one of its first cell
+                formula = variables.variables.raw(key).lstrip("=") + " (shared)"
+            own = elapsed - nested
+            self.cells[key] = CellProfile(formula, lex, parse, compile, own)
+
+    def memoized(self, hit: bool) -> None:
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def evaluated(self, key, precedents) -> None:
+        depths = self.depths
+        depths[key] = 1 + max((depths.get(p, 0) for p in precedents), default=0)
+
+    def top(self, n: int = 10) -> list[tuple[str, CellProfile]]:
+        "the n cells that took the longest to evaluate"
+        return sorted(self.cells.items(), key=lambda item: -sum(item[1][1:]))[:n]
+
+    def report(self, n: int = 10) -> str:
+        lines = [
+            f"cells evaluated: {len(self.cells)}",
+            f"value cache hits: {rate(self.cache_hits, self.cache_misses)}",
+            f"formula cache hits: {rate(self.formula_hits, self.formula_misses)}",
+            f"max dependency depth: {max(self.depths.values(), default=0)}",
+            "",
+            f"{'cell':<10}{'total':>10}{'lex':>10}{'parse':>10}{'compile':>10}"
+            f"{'eval':>10}{'depth':>7}  formula (times in ms)",
+        ]
+        for cell, profile in self.top(n):
+            times = [sum(profile[1:]), *profile[1:]]
+            lines.append(
+                f"{cell:<10}"
+                + "".join(f"{seconds * 1000:>10.3f}" for seconds in times)
+                + f"{self.depths.get(cell, 0):>7}  {profile.formula}"
+            )
+        lines += ["", f"{'function':<10}{'calls':>10}"]
+        for name, calls in self.calls.most_common():
+            lines.append(f"{name:<10}{calls:>10}")
+        return "\n".join(lines)
+
+
+def rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits}/{total} ({hits / total if total else 0:.1%})"
@@ -0,0 +1,182 @@
+import math
+from array import array
+from typing import Callable
+
+from grid import FLOAT, INT, Grid
+
+
+class SummedAreaTable:
+    """prefix sums of the int cells of a grid over both its rows and columns,
+    entry [i][j] covers the rows before i and the columns before j, so the sum
+    of any rectangle takes four lookups. the int cells are counted the same way
+    to know if a rectangle only holds ints. floats aren't summed: a float sum
+    taken from prefix sums isn't rounded like the sum of the range read in
+    order, so ranges holding floats print the same with or without the index"""
+
+    __slots__ = ("width", "sums", "counts")
+
+    def __init__(self, width: int) -> None:
+        self.width = width  # number of columns covered
+        self.sums: list[list[int]] = [[0] * (width + 1)]
+        self.counts: list[array] = [array("q", bytes(8 * (width + 1)))]
+
+    def __len__(self) -> int:
+        return len(self.sums)
+
+    def extend(self, grid: Grid, stop: int) -> None:
+        "computes the prefix sums up to the row stop"
+        for row in range(len(self) - 1, stop):
+            sums, counts = self.sums[-1][:], array("q", self.counts[-1])
+            row_sum = row_count = 0
+            for col in range(self.width):
+                if grid.kind(row, col) == INT:
+                    row_sum += int(grid.numbers[col][row])
+                    row_count += 1
+                sums[col + 1] += row_sum
+                counts[col + 1] += row_count
+            self.sums.append(sums)
+            self.counts.append(counts)
+
+    def truncate(self, row: int) -> None:
+        "drops the prefix sums covering a row, they are computed again when needed"
+        del self.sums[row + 1 :]
+        del self.counts[row + 1 :]
+
+    def sum(self, row0: int, col0: int, row1: int, col1: int) -> int | None:
+        "sum of a rectangle of the rows before len(self), None unless all ints"
+        top, bottom = row0, row1 + 1
+        left, right = col0, col1 + 1
+        counts = self.counts
+        n = counts[bottom][right] - counts[top][right]
+        n -= counts[bottom][left] - counts[top][left]
+        if n != (bottom - top) * (right - left):
+            return None  # floats, text, formulas and empty cells are evaluated
+        sums = self.sums
+        return (
+            sums[bottom][right] - sums[top][right] - sums[bottom][left] + sums[top][left]
+        )
+
+
+def first_max(a, b):
+    "the max of two values, the first one on ties like max()"
+    return b if b > a else a
+
+
+def first_min(a, b):
+    return b if b < a else a
+
+
+class ColumnExtrema:
+    """segment trees of the max and the min of a column, answering queries over
+    any interval of rows and point updates in O(log n). cells that aren't
+    numbers are infinities that win every comparison, so a query over them
+    returns a infinity and falls back to evaluating the range"""
+
+    __slots__ = ("size", "maxima", "minima")
+
+    def __init__(self, grid: Grid, col: int) -> None:
+        self.size = size = 1 << max(grid.n_rows - 1, 0).bit_length()
+        self.maxima = [math.inf] * (2 * size)  # node i has children 2i and 2i + 1
+        self.minima = [-math.inf] * (2 * size)
+        for row in range(grid.n_rows):
+            self.maxima[size + row], self.minima[size + row] = leaf(grid, row, col)
+        for node in range(size - 1, 0, -1):
+            self.pull(node)
+
+    def pull(self, node: int) -> None:
+        maxima, minima = self.maxima, self.minima
+        maxima[node] = first_max(maxima[2 * node], maxima[2 * node + 1])
+        minima[node] = first_min(minima[2 * node], minima[2 * node + 1])
+
+    def update(self, grid: Grid, row: int, col: int) -> None:
+        node = self.size + row
+        self.maxima[node], self.minima[node] = leaf(grid, row, col)
+        while node > 1:
+            node //= 2
+            self.pull(node)
+
+    def query(self, tree: list, pick: Callable, start, row0: int, row1: int):
+        "reduces the rows row0 to row1 of a tree, in order"
+        left, right = start, start
+        lo, hi = row0 + self.size, row1 + self.size + 1
+        while lo < hi:
+            if lo & 1:
+                left = pick(left, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                right = pick(tree[hi], right)
+            lo, hi = lo // 2, hi // 2
+        return pick(left, right)
+
+
+def leaf(grid: Grid, row: int, col: int) -> tuple:
+    "the leaves of a cell in the max and min trees"
+    if grid.kind(row, col) in (INT, FLOAT):
+        value = grid.cell(row, col)
+        return value, value
+    return math.inf, -math.inf
+
+
+class RangeIndex:
+    """opt in index of the numeric cells of a grid, answers SUM over any
+    rectangle of ints in constant time, and MAX and MIN over any rectangle of
+    numbers in time proportional to its number of columns times log n, not its
+    number of cells.
+
+    the summed area table is computed down to the last row queried and cut at
+    the row of a cell when the cell is updated. the max and min trees of a
+    column are built the first time it's queried and updated in place"""
+
+    def __init__(self, grid: Grid) -> None:
+        self.grid = grid
+        self.table: SummedAreaTable | None = None
+        self.extrema: dict[int, ColumnExtrema] = {}
+
+    def update(self, row: int, col: int) -> None:
+        "a cell changed, the prefix sums below it are no longer valid"
+        if self.table is not None:
+            if col < self.table.width:
+                self.table.truncate(row)
+            else:
+                self.table = None  # the grid outgrew the table
+        if (extrema := self.extrema.get(col)) is not None:
+            if row < extrema.size:
+                extrema.update(self.grid, row, col)
+            else:
+                del self.extrema[col]  # the column outgrew its trees
+
+    def sum(self, bounds: tuple[int, int, int, int]) -> int | None:
+        "sum of a rectangle, None unless all of its cells are ints"
+        row0, col0, row1, col1 = bounds
+        if col1 >= len(self.grid.kinds) or row1 >= self.grid.n_rows:
+            return None  # empty cells
+        table = self.table
+        if table is None:
+            table = self.table = SummedAreaTable(len(self.grid.kinds))
+        if len(table) <= row1 + 1:
+            table.extend(self.grid, row1 + 1)
+        return table.sum(row0, col0, row1, col1)
+
+    def extreme(self, bounds: tuple[int, int, int, int], largest: bool):
+        "max or min of a rectangle, None unless all of its cells are numbers"
+        row0, col0, row1, col1 = bounds
+        pick, start = (first_max, -math.inf) if largest else (first_min, math.inf)
+        result = start
+        for col in range(col0, col1 + 1):
+            extrema = self.extrema.get(col)
+            if extrema is None:
+                extrema = self.extrema[col] = ColumnExtrema(self.grid, col)
+            if row1 >= extrema.size:
+                return None  # empty cells
+            tree = extrema.maxima if largest else extrema.minima
+            result = pick(result, extrema.query(tree, pick, start, row0, row1))
+        return None if math.isinf(result) else result
+
+    def reduce(self, bounds: tuple[int, int, int, int], fn) -> object | None:
+        "reduces a rectangle by one of the indexed functions, None otherwise"
+        if fn is sum:
+            return self.sum(bounds)
+        if fn is max or fn is min:
+            return self.extreme(bounds, largest=fn is max)
+        return None
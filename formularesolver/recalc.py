@@ -0,0 +1,215 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from parser import references
+from typing import Callable
+
+from grid import Grid
+from interpreter import RangeRef, formula_resolver, parse_formula, reduce_column
+from lexer import SyntaxError as LexerSyntaxError
+from shared import SharedFormula, shared_references
+from utils import cell_name, range_bounds
+
+Position = tuple[int, int]
+
+
+PARALLEL_BATCH_SIZE = 512  # formulas sent to a worker at a time
+
+
+class CircularReferenceError(Exception):
+    pass
+
+
+class Snapshot(dict):
+    "values and range columns read by a batch of formulas, shipped to a worker"
+
+    def __init__(self) -> None:
+        self.columns: dict[tuple[int, int, int, int], object] = {}  # by bounds
+        super().__init__()
+
+    def __missing__(self, key: str):
+        return ""
+
+    def column(self, bounds: tuple[int, int, int, int]):
+        if bounds in self.columns:
+            return self.columns[bounds]
+        # single cells are shipped by name, even when read as a range like A1:A1
+        return [self[cell_name(*bounds[:2])]]
+
+    def range_values(self, ref: RangeRef):
+        return self.column(ref.bounds)
+
+    def reduce_range(self, ref: RangeRef, fn):
+        return reduce_column(self.column(ref.bounds), fn)
+
+
+def dependency_graph(
+    grid: Grid, shared: dict[Position, SharedFormula] | None = None
+) -> dict[Position, set[Position]]:
+    """maps each formula cell of the grid to the formula cells it reads, the
+    references of shared formulas are moved from the first cell of their group"""
+    shared = shared or {}
+    rows = formula_rows(grid)
+    return {
+        position: cell_precedents(grid, shared, rows, position)
+        for position in grid.texts
+    }
+
+
+def upstream_graph(
+    grid: Grid,
+    shared: dict[Position, SharedFormula],
+    rows: dict[int, list[int]],
+    position: Position,
+    done: Callable[[Position], bool],
+) -> dict[Position, set[Position]]:
+    """the dependency graph of a formula cell and of the formula cells it reads,
+    directly or not, given the formula_rows of the grid. the cells for which
+    done is true and the ones only read by them are left out"""
+    graph: dict[Position, set[Position]] = {}
+    stack = [position]
+    while stack:
+        cell = stack.pop()
+        if cell not in graph:
+            precedents = cell_precedents(grid, shared, rows, cell)
+            graph[cell] = {p for p in precedents if not done(p)}
+            stack.extend(graph[cell])
+    return graph
+
+
+def formula_rows(grid: Grid) -> defaultdict[int, list[int]]:
+    "rows of the formula cells of each column, sorted to find them in ranges"
+    rows: defaultdict[int, list[int]] = defaultdict(list)
+    for row, col in sorted(grid.texts):
+        rows[col].append(row)
+    return rows
+
+
+def cell_precedents(
+    grid: Grid,
+    shared: dict[Position, SharedFormula],
+    rows: dict[int, list[int]],
+    position: Position,
+) -> set[Position]:
+    "formula cells read by a formula cell, given the formula_rows of the grid"
+    if position in shared:
+        refs = shared_references(shared[position], *position)
+    else:
+        refs = formula_references(grid.texts[position].lstrip("="))
+    precedents = set()
+    for start, stop in refs:
+        row0, col0, row1, col1 = range_bounds(start, stop)
+        for col in range(col0, col1 + 1):
+            column = rows.get(col, [])
+            lo, hi = bisect_left(column, row0), bisect_right(column, row1)
+            precedents.update((row, col) for row in column[lo:hi])
+    return precedents
+
+
+def topological_levels(graph: dict[Position, set[Position]]) -> list[list[Position]]:
+    """groups the cells of a dependency graph in levels, each level only depends
+    on the previous ones. raises CircularReferenceError on cycles"""
+    n_precedents = {cell: len(precedents) for cell, precedents in graph.items()}
+    dependents = defaultdict(list)
+    for cell, precedents in graph.items():
+        for precedent in precedents:
+            dependents[precedent].append(cell)
+
+    levels = []
+    level = sorted(cell for cell, n in n_precedents.items() if n == 0)
+    while level:
+        levels.append(level)
+        next_level = []
+        for cell in level:
+            for dependent in dependents[cell]:
+                n_precedents[dependent] -= 1
+                if n_precedents[dependent] == 0:
+                    next_level.append(dependent)
+        level = sorted(next_level)
+
+    if sum(map(len, levels)) < len(graph):
+        raise CircularReferenceError(
+            "circular reference between cells: "
+            + ", ".join(cell_name(*cell) for cell in cycle_cells(graph, n_precedents))
+        )
+    return levels
+
+
+def cycle_cells(
+    graph: dict[Position, set[Position]], n_precedents: dict[Position, int]
+) -> list[Position]:
+    "cells left after a topological sort, without the ones only downstream of a cycle"
+    remaining = {cell for cell, n in n_precedents.items() if n > 0}
+    n_dependents = dict.fromkeys(remaining, 0)
+    for cell in remaining:
+        for precedent in graph[cell] & remaining:
+            n_dependents[precedent] += 1
+
+    stack = [cell for cell, n in n_dependents.items() if n == 0]
+    while stack:
+        cell = stack.pop()
+        remaining.discard(cell)
+        for precedent in graph[cell] & remaining:
+            n_dependents[precedent] -= 1
+            if n_dependents[precedent] == 0:
+                stack.append(precedent)
+    return sorted(remaining)
+
+
+def formula_references(formula: str) -> list[tuple[str, str]]:
+    "cells and ranges read by a formula, empty when the formula is invalid"
+    try:
+        return list(references(parse_formula(formula)))
+    except (SyntaxError, LexerSyntaxError):
+        return []  # the error is raised when the formula is evaluated
+
+
+def snapshot_batch(variables, batch: list[Position]) -> tuple[list, Snapshot]:
+    "formulas of a batch of cells and the values they read, evaluated in variables"
+    formulas, values = [], Snapshot()
+    for row, col in batch:
+        formula = variables.grid.texts[row, col].lstrip("=")
+        formulas.append(formula)
+        for start, stop in formula_references(formula):
+            if start == stop:
+                values[start] = values[start.replace("$", "")] = variables[start]
+            else:
+                bounds = range_bounds(start, stop)
+                values.columns[bounds] = variables.range_column(bounds)
+    return formulas, values
+
+
+def evaluate_batch(payload: tuple[list, Snapshot]) -> list:
+    "evaluates a batch of formulas in a worker process"
+    formulas, values = payload
+    return [
+        formula_resolver(formula, values) if formula else "" for formula in formulas
+    ]
+
+
+def parallel_recalculate(variables, levels: list[list[Position]], jobs: int) -> None:
+    """evaluates each topological level of a sheet in batches on a process pool,
+    the results and their dependency edges are stored back in variables"""
+    cache = variables.cache
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for level in levels:
+            level = [cell for cell in level if cell_name(*cell) not in cache]
+            # small levels are not worth the trip to the workers
+            if len(level) < PARALLEL_BATCH_SIZE:
+                for row, col in level:
+                    variables.cell_value(cell_name(row, col))
+                continue
+
+            size = max(1, min(PARALLEL_BATCH_SIZE, len(level) // jobs))
+            batches = [level[i : i + size] for i in range(0, len(level), size)]
+            payloads = [snapshot_batch(variables, batch) for batch in batches]
+            results = executor.map(evaluate_batch, payloads)
+            for batch, (formulas, _), values in zip(batches, payloads, results):
+                for cell, formula, value in zip(batch, formulas, values):
+                    reads = set()
+                    for start, stop in formula_references(formula):
+                        if start == stop:
+                            reads.add(start.replace("$", ""))
+                        else:
+                            reads.add(range_bounds(start, stop))
+                    variables.store(cell_name(*cell), value, reads)
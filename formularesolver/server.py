@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+from pathlib import Path
+from typing import Callable
+
+from main import csv2variables, variables2csv
+from sheet import Variables
+from utils import cell_index
+
+DEFAULT_PORT = 8765
+
+
+class SheetServer:
+    """keeps sheets loaded in memory and serves the commands of the REPL over a
+    json lines protocol, one request and one response object per line
+
+        {"id": 1, "op": "open", "sheet": "test.csv"}
+        {"id": 2, "op": "set", "sheet": "test.csv", "cell": "A1", "value": "=2"}
+        {"id": 2, "value": 2, "updated": ["D1"]}
+
+    requests are handled concurrently, the ones on the same sheet in the order
+    they were received. evaluation runs on a thread of the default executor so
+    it doesn't block the event loop"""
+
+    def __init__(self) -> None:
+        self.sheets: dict[str, Variables] = {}
+        self.locks: dict[str, asyncio.Lock] = {}  # sheets aren't thread safe
+        self.operations: dict[str, Callable] = {
+            "open": self.open,
+            "close": self.close,
+            "set": self.set,
+            "get": self.get,
+            "dump": self.dump,
+            "list": self.list,
+        }
+
+    async def handle(self, reader, writer) -> None:
+        "serves a client connection until it's closed"
+        lock, tasks = asyncio.Lock(), set()
+
+        async def respond(line: bytes) -> None:
+            response = await self.execute(line)
+            async with lock:
+                writer.write(json.dumps(response, default=str).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def execute(self, line: bytes) -> dict:
+        "runs a request and returns its response, errors are reported in it"
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("requests must be json objects")
+            response["id"] = request.get("id")
+            operation = self.operations.get(request.get("op"))
+            if operation is None:
+                raise ValueError(f"unknown operation: {request.get('op')!r}")
+            response.update(await operation(request))
+        except Exception as e:
+            response["error"] = f"{type(e).__name__}: {e}"
+        return response
+
+    async def run(self, request: dict, fn: Callable):
+        """runs fn(sheet) on the executor once the requests received before it
+        on the same sheet are done"""
+        name = request.get("sheet")
+        async with self.locks.setdefault(name, asyncio.Lock()):
+            if name not in self.sheets:
+                raise KeyError(f"sheet {name!r} isn't open")
+            variables = self.sheets[name]
+            return await asyncio.get_running_loop().run_in_executor(None, fn, variables)
+
+    async def open(self, request: dict) -> dict:
+        "loads a csv file, the sheet is named after the file unless given a name"
+        path = request.get("path") or request["sheet"]
+        name = request.get("sheet", path)
+        if not Path(path).is_file():
+            raise FileNotFoundError(f"file {path} doesn't exist")
+        async with self.locks.setdefault(name, asyncio.Lock()):
+            loop = asyncio.get_running_loop()
+            self.sheets[name] = await loop.run_in_executor(None, csv2variables, path)
+        return {"sheet": name, "shape": self.sheets[name].grid.shape}
+
+    async def close(self, request: dict) -> dict:
+        await self.run(request, lambda variables: self.sheets.pop(request["sheet"]))
+        return {}
+
+    async def set(self, request: dict) -> dict:
+        "sets a cell, returns its value and the other cells whose value changed"
+        cell, raw = request["cell"], str(request["value"])
+
+        def set_cell(variables: Variables):
+            changed = variables.set(cell, raw) - {cell.replace("$", "")}
+            return variables[cell], sorted(changed, key=cell_index)
+
+        value, changed = await self.run(request, set_cell)
+        return {"value": value, "updated": changed}
+
+    async def get(self, request: dict) -> dict:
+        cell = request["cell"]
+
+        def get_cell(variables: Variables):
+            return variables[cell], variables.raw(cell)
+
+        value, formula = await self.run(request, get_cell)
+        return {"value": value, "formula": formula}
+
+    async def dump(self, request: dict) -> dict:
+        "evaluates the whole sheet, returns it as csv"
+
+        def dump_sheet(variables: Variables):
+            return "".join(variables2csv(variables))
+
+        return {"csv": await self.run(request, dump_sheet)}
+
+    async def list(self, request: dict) -> dict:
+        return {"sheets": sorted(self.sheets)}
+
+
+async def serve(
+    server: SheetServer,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    unix: str | None = None,
+) -> None:
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        description="serves sheets kept in memory over a json lines protocol"
+    )
+    arg_parser.add_argument("filenames", nargs="*", help="csv files to open")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--unix", help="listen on a unix socket instead")
+    return arg_parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    server = SheetServer()
+    for filename in args.filenames:
+        server.sheets[filename] = csv2variables(filename)
+    asyncio.run(serve(server, args.host, args.port, args.unix))
+
+
+if __name__ == "__main__":
+    main()
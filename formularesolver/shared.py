@@ -0,0 +1,116 @@
+from collections import defaultdict, namedtuple
+from collections.abc import Mapping
+from parser import ASTNode, FunctionNode, references
+from typing import Iterator
+
+from interpreter import RangeRef, parse_formula
+from lexer import SyntaxError as LexerSyntaxError
+from lexer import scan
+from optimizer import walk_nodes
+from utils import range_bounds, relative_cell, shift_cell
+
+Position = tuple[int, int]
+
+# a formula filled from the cell at (row, col) to other cells of the sheet
+SharedFormula = namedtuple(
+    "SharedFormula", ["formula", "row", "col", "references", "ranges"]
+)
+
+
+def relative_formula(formula: str, row: int, col: int) -> str:
+    """formula in relative R1C1 notation, the same for all the cells it was filled
+    to. only the cell tokens are rewritten, not the text of strings, function
+    names or numbers like 1E5 that look like references"""
+    try:
+        tokens = [(m.lastgroup, m.group()) for m in scan(formula)]
+    except LexerSyntaxError:
+        return formula  # the error is raised when the cell is evaluated
+    return "".join(
+        relative_cell(text, row, col) if kind == "variable" else text
+        for kind, text in tokens
+    )
+
+
+def share_formulas(formulas: dict[Position, str]) -> dict[Position, SharedFormula]:
+    """groups the formulas that only differ by the offset of their references, the
+    cells of a group are all evaluated with the parsed formula of the first one"""
+    groups = defaultdict(list)
+    for position, formula in formulas.items():
+        groups[relative_formula(formula, *position)].append(position)
+
+    shared = {}
+    for positions in groups.values():
+        if len(positions) < 2:
+            continue
+        row, col = min(positions)
+        if (group := shared_group(formulas[row, col], row, col)) is not None:
+            shared.update(dict.fromkeys(positions, group))
+    return shared
+
+
+def shared_group(formula: str, row: int, col: int) -> SharedFormula | None:
+    "a group of the formula at the (row, col) cell, None if it can't be shared"
+    try:
+        ast = parse_formula(formula)
+    except (SyntaxError, LexerSyntaxError):
+        return None  # the error is raised when the cells are evaluated
+    refs = list(dict.fromkeys(references(ast)))
+    range_refs = set(range_references(ast))
+    ranges = {range_bounds(*range_ref): range_ref for range_ref in range_refs}
+    if len(ranges) < len(range_refs):
+        return None  # $A$1:A2 and A1:A2 can't be told apart by their bounds
+    return SharedFormula(formula, row, col, refs, ranges)
+
+
+def range_references(ast: ASTNode | None) -> Iterator[tuple[str, str]]:
+    "yields the (start, stop) cells of the ranges of a AST"
+    for node in walk_nodes(ast) if ast is not None else ():
+        if isinstance(node, FunctionNode) and node.value == ":":
+            start, stop = node.children
+            yield start.value, stop.value
+
+
+def shared_references(group: SharedFormula, row: int, col: int) -> list:
+    "cells and ranges read by the formula of a group at the (row, col) cell"
+    rows, cols = row - group.row, col - group.col
+    return [
+        (shift_cell(start, rows, cols), shift_cell(stop, rows, cols))
+        for start, stop in group.references
+    ]
+
+
+def shared_view(group: SharedFormula, variables, row: int, col: int) -> "SharedView":
+    "variables to evaluate the formula of a group with at the (row, col) cell"
+    return SharedView(variables, group, row - group.row, col - group.col)
+
+
+class SharedView(Mapping):
+    "variables seen by a cell of a group, references of the formula are moved"
+
+    __slots__ = ("variables", "group", "rows", "cols")
+
+    def __init__(self, variables, group: SharedFormula, rows: int, cols: int):
+        self.variables = variables
+        self.group = group
+        self.rows, self.cols = rows, cols  # offset from the first cell of the group
+
+    def __getitem__(self, key: str):
+        return self.variables[shift_cell(key, self.rows, self.cols)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.variables)
+
+    def __len__(self) -> int:
+        return len(self.variables)
+
+    def shift(self, ref: RangeRef) -> RangeRef:
+        start, stop = self.group.ranges[ref.bounds]
+        start = shift_cell(start, self.rows, self.cols)
+        stop = shift_cell(stop, self.rows, self.cols)
+        return RangeRef(range_bounds(start, stop), self.variables)
+
+    def range_values(self, ref: RangeRef):
+        return self.shift(ref)
+
+    def reduce_range(self, ref: RangeRef, fn):
+        return self.shift(ref).reduce(fn)
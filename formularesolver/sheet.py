@@ -0,0 +1,382 @@
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import MutableMapping
+from typing import Generator, Iterator
+
+from grid import TEXT, Grid
+from interpreter import (RangeRef, formula_resolver, pack_block,
+                         reduce_column, to_column)
+from recalc import (CircularReferenceError, dependency_graph, formula_rows,
+                    parallel_recalculate, topological_levels, upstream_graph)
+from shared import share_formulas, shared_view
+from utils import bounds_cells, cell_index, cell_name, in_bounds
+
+SMALL_RANGE = 64  # ranges up to this size are linked to each of their cells
+
+
+class Variables(MutableMapping):
+    "evaluate a cell variable when getitem is called and memoize its value"
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.grid = Grid()  # raw cells
+        # keys are cell names or (row0, col0, row1, col1) bounds of ranges
+        self.cache: dict = {}  # key -> evaluated value
+        self.dependents: defaultdict = defaultdict(set)  # key -> readers
+        self.precedents: defaultdict = defaultdict(set)  # key -> reads
+        self.evaluating: list = []  # stack of keys being evaluated
+        # large ranges are invalidated by their bounds, not by edges to cells
+        self.ranges: set[tuple[int, int, int, int]] = set()
+        self.shared: dict = {}  # (row, col) -> formula shared with other cells
+        self.profiler = None  # opt in instrumentation of the evaluation
+        self.range_index = None  # opt in RangeIndex answering range queries
+        # sorted rows of the formula cells of each column, built on first use
+        # for the grid it was built from and kept up to date by updated
+        self.formula_rows: defaultdict[int, list[int]] | None = None
+        self.formula_rows_grid: Grid | None = None
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key: str):
+        if "$" in key:
+            key = key.replace("$", "")
+        if not self.evaluating and key not in self.cache:
+            self.evaluate_upstream(key)
+        return self.cell_value(key)
+
+    def __setitem__(self, key: str, value: str) -> None:
+        index = self.index(key)
+        self.invalidate_cell(key.replace("$", ""), *index)
+        self.shared.pop(index, None)
+        self.grid[index] = value
+        self.updated(*index)
+
+    def __delitem__(self, key: str) -> None:
+        index = self.index(key)
+        self.invalidate_cell(key.replace("$", ""), *index)
+        self.shared.pop(index, None)
+        del self.grid[index]
+        self.updated(*index)
+
+    def __contains__(self, key) -> bool:
+        try:
+            return self.index(key) in self.grid
+        except KeyError:
+            return False
+
+    def __iter__(self) -> Iterator[str]:
+        return (cell_name(row, col) for row, col in self.grid)
+
+    def __len__(self) -> int:
+        return len(self.grid)
+
+    @staticmethod
+    def index(key: str) -> tuple[int, int]:
+        try:
+            return cell_index(key)
+        except (ValueError, TypeError):
+            raise KeyError(key) from None
+
+    def raw(self, key: str) -> str:
+        "returns the raw content (formula or value) of a cell"
+        return self.grid[self.index(key)]
+
+    def range_column(self, bounds: tuple[int, int, int, int]):
+        "values of a range packed in a column, shared by all formulas using it"
+        return self.memoize(bounds, self.evaluate_range)
+
+    def range_values(self, ref: RangeRef):
+        return self.range_column(ref.bounds)
+
+    def reduce_range(self, ref: RangeRef, fn):
+        bounds = ref.bounds
+        # small ranges are cheaper to read than to query
+        if (
+            self.range_index is not None
+            and len(ref) > SMALL_RANGE
+            and bounds not in self.cache
+        ):
+            value = self.range_index.reduce(bounds, fn)
+            if value is not None:
+                # the reader depends on the range as if its values had been read
+                if self.evaluating:
+                    self.link(bounds, self.evaluating[-1])
+                self.track_range(bounds)
+                return value
+        return reduce_column(self.range_column(bounds), fn)
+
+    def value_at(self, row: int, col: int):
+        "value of a cell by position, only formulas go through the cache"
+        cell = self.grid.cell(row, col)
+        if isinstance(cell, str) and cell:
+            return self[cell_name(row, col)]
+        return cell
+
+    def share_formulas(self) -> None:
+        "groups the formulas filled down or across, parsed once per group"
+        texts = self.grid.texts
+        self.shared = share_formulas({p: raw.lstrip("=") for p, raw in texts.items()})
+
+    def evaluate_cell(self, key: str):
+        index = self.index(key)
+        if (group := self.shared.get(index)) is not None:
+            formula, variables = group.formula, shared_view(group, self, *index)
+        else:
+            cell = self.grid.cell(*index)
+            if not isinstance(cell, str):
+                return cell  # numbers don't need to be parsed
+            formula, variables = cell.lstrip("="), self
+            if not formula:
+                return ""
+        if self.profiler is not None:
+            return self.profiler.resolve(key, formula, variables)
+        return formula_resolver(formula, variables=variables)
+
+    def cell_value(self, key: str):
+        "value of a cell, the cells it reads are evaluated recursively"
+        return self.memoize(key, self.evaluate_cell)
+
+    def evaluate_upstream(self, key: str) -> None:
+        """evaluates the uncached formula cells read by a cell, directly or not,
+        in dependency order, so reading it doesn't recurse through long chains"""
+        position = self.index(key)
+        if position not in self.grid.texts:
+            return
+        graph = upstream_graph(
+            self.grid,
+            self.shared,
+            self.formula_index(),
+            position,
+            lambda p: cell_name(*p) in self.cache,
+        )
+        if len(graph) == 1:
+            return
+        try:
+            levels = topological_levels(graph)
+        except CircularReferenceError:
+            return  # raised when the cell is read, if the cycle is reached
+        for level in levels:
+            for row, col in level:
+                if (row, col) == position:
+                    continue
+                try:
+                    self.cell_value(cell_name(row, col))
+                except Exception:
+                    # raised again if the cell is read, a cell can read it from
+                    # a branch of IF or IFERROR that is never taken or caught
+                    pass
+
+    def formula_index(self) -> defaultdict[int, list[int]]:
+        "rows of the formula cells of each column, sorted to find them in ranges"
+        if self.formula_rows is None or self.formula_rows_grid is not self.grid:
+            self.formula_rows = formula_rows(self.grid)
+            self.formula_rows_grid = self.grid
+        return self.formula_rows
+
+    def track_range(self, bounds: tuple[int, int, int, int]) -> None:
+        "records how a range is invalidated when one of its cells changes"
+        row0, col0, row1, col1 = bounds
+        if (row1 - row0 + 1) * (col1 - col0 + 1) <= SMALL_RANGE:
+            for cell in bounds_cells(bounds):
+                self.link(cell, bounds)
+        else:
+            self.ranges.add(bounds)
+
+    def evaluate_range(self, bounds: tuple[int, int, int, int]):
+        row0, col0, row1, col1 = bounds
+        self.track_range(bounds)
+        if block := self.grid.numeric_block(*bounds):
+            return pack_block(*block)
+        return to_column(
+            [
+                self.value_at(row, col)
+                for col in range(col0, col1 + 1)
+                for row in range(row0, row1 + 1)
+            ]
+        )
+
+    def updated(self, row: int, col: int) -> None:
+        "the raw content of a cell changed"
+        if self.range_index is not None:
+            self.range_index.update(row, col)
+        if self.formula_rows is not None and self.formula_rows_grid is self.grid:
+            rows = self.formula_rows[col]
+            i = bisect_left(rows, row)
+            indexed = i < len(rows) and rows[i] == row
+            if (row, col) in self.grid.texts:
+                if not indexed:
+                    rows.insert(i, row)
+            elif indexed:
+                del rows[i]
+
+    def link(self, key, reader) -> None:
+        "records that the value of reader was computed from the value of key"
+        self.dependents[key].add(reader)
+        self.precedents[reader].add(key)
+
+    def memoize(self, key, evaluate):
+        # record the edge reader -> key when called from inside a formula
+        if self.evaluating:
+            self.link(key, self.evaluating[-1])
+
+        if self.profiler is not None:
+            self.profiler.memoized(key in self.cache)
+        if key in self.cache:
+            return self.cache[key]
+        if key in self.evaluating:
+            cycle = self.evaluating[self.evaluating.index(key) :] + [key]
+            raise CircularReferenceError(
+                "circular reference: " + " -> ".join(map(str, cycle))
+            )
+
+        self.evaluating.append(key)
+        try:
+            value = evaluate(key)
+        finally:
+            self.evaluating.pop()
+        self.cache[key] = value
+        if self.profiler is not None:
+            self.profiler.evaluated(key, self.precedents.get(key, ()))
+        return value
+
+    def store(self, key: str, value, reads: set) -> None:
+        "caches a value evaluated elsewhere along with the keys it was read from"
+        self.cache[key] = value
+        for read in reads:
+            self.link(read, key)
+
+    def set(self, key: str, value: str) -> set[str]:
+        """sets the raw content of a cell and recomputes the cells downstream of
+        it in dependency order, returns the cells whose value changed. cells
+        whose precedents kept their values are not recomputed"""
+        key = key.replace("$", "")
+        row, col = index = self.index(key)
+        region = self.downstream(key, row, col)
+        old = {k: self.cache.pop(k) for k in region if k in self.cache}
+        if key not in old and self.grid.kind(row, col) != TEXT:
+            old[key] = self.grid.cell(row, col)  # numbers are read from the grid
+        self.shared.pop(index, None)
+        self.grid[index] = value
+        self.updated(row, col)
+
+        changed = set()
+        for k in region:
+            if k in self.cache:
+                new = self.cache[k]  # evaluated by a key earlier in the region
+            elif (
+                k in old
+                and k != key
+                and not (isinstance(k, tuple) and in_bounds(k, row, col))
+                and not self.precedents.get(k, set()) & changed
+            ):
+                self.cache[k] = old[k]  # none of its reads changed, keeps its edges
+                continue
+            else:
+                for precedent in self.precedents.pop(k, ()):
+                    self.dependents[precedent].discard(k)
+                if isinstance(k, tuple):
+                    # read again by the cells downstream, like the range index
+                    # does, without building its column
+                    self.track_range(k)
+                    changed.add(k)
+                    continue
+                new = self.cell_value(k)
+            if isinstance(k, tuple) or k not in old or not same_value(old[k], new):
+                changed.add(k)
+        return {k for k in changed if isinstance(k, str)}
+
+    def downstream(self, key: str, row: int, col: int) -> list:
+        "keys depending on a cell, itself and its large ranges included, in order"
+        seeds = [key] + [b for b in self.ranges if in_bounds(b, row, col)]
+        order, visited = [], set()
+        for seed in seeds:
+            if seed in visited:
+                continue
+            visited.add(seed)
+            # iterative depth first search, keys are added after their dependents
+            stack = [(seed, iter(self.dependents.get(seed, ())))]
+            while stack:
+                k, dependents = stack[-1]
+                for dependent in dependents:
+                    if dependent not in visited:
+                        visited.add(dependent)
+                        dependents = self.dependents.get(dependent, ())
+                        stack.append((dependent, iter(dependents)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(k)
+        order.reverse()
+        return order
+
+    def recalculate(self, jobs: int = 1) -> None:
+        """evaluates every formula of the sheet in dependency order, so reading a
+        cell never recurses into the cells it depends on. with jobs > 1 the
+        independent cells of each level are evaluated on a process pool"""
+        cache = self.cache
+        if all(cell_name(row, col) in cache for row, col in self.grid.texts):
+            return  # nothing to do, set keeps the cache up to date
+        levels = topological_levels(dependency_graph(self.grid, self.shared))
+        if jobs > 1:
+            parallel_recalculate(self, levels, jobs)
+            return
+        for level in levels:
+            for row, col in level:
+                self.cell_value(cell_name(row, col))
+
+    def invalidate_cell(self, key: str, row: int, col: int) -> None:
+        "invalidate a cell and the large ranges that contain it"
+        self.invalidate(key)
+        for bounds in [b for b in self.ranges if in_bounds(b, row, col)]:
+            self.ranges.discard(bounds)
+            self.invalidate(bounds)
+
+    def invalidate(self, key) -> None:
+        "drop the cached value of a cell and of every cell downstream of it"
+        stack = [key]
+        while stack:
+            cell = stack.pop()
+            self.cache.pop(cell, None)
+            # edges are recorded again when the cell is re-evaluated
+            for precedent in self.precedents.pop(cell, ()):
+                if precedent in self.dependents:
+                    self.dependents[precedent].discard(cell)
+            stack.extend(self.dependents.pop(cell, ()))
+
+    def __repr__(self) -> str:
+        self.recalculate()
+        cells = [list(line) for line in get_bounds(self)]
+
+        # gen header with col names from the first line
+        header = ["|      |"]
+        for cell in cells[0]:
+            cell = "".join(c for c in cell if not c.isnumeric())  # remove numbers
+            header.append(f"{cell:^6}|")
+        header.append("\n")
+
+        # construct and add table divisor / spacer
+        len_header = len("".join(header)) - 1
+        div = "-" * len_header + "\n"
+        repr = [div] + header + [div]
+
+        # iter all cells and add then to the table representation
+        for line in cells:
+            # add line number
+            n = "".join(c for c in line[0] if c.isnumeric())  # remove letters
+            repr.append(f"|{n:^6}|")
+            # add cells
+            for cell in line:
+                repr.append(f"{self[cell]:>6}|")
+            repr.append("\n")
+
+        repr.append(div)
+        return "".join(repr)
+
+
+def same_value(a, b) -> bool:
+    "strict equality of cell values, 1 and 1.0 or True are different values"
+    return type(a) is type(b) and a == b
+
+
+def get_bounds(variables: Variables) -> Generator:
+    "returns a list of excel cells where the indices are the csv positions"
+    n_rows, n_cols = variables.grid.shape
+    return ((cell_name(row, col) for col in range(n_cols)) for row in range(n_rows))
@@ -0,0 +1,270 @@
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from itertools import chain
+from pathlib import Path
+
+from grid import Grid
+from shared import shared_group
+from utils import cell_index, cell_name
+
+MAGIC = b"FRSNAP\0\0"
+VERSION = 2
+# magic, version, byte order, sha256 of the csv, rows, columns
+HEADER = struct.Struct("<8sI8s32sqq")
+SUFFIX = ".snapshot"
+
+# kinds of the cached values of the formula cells
+NOT_CACHED, INT_VALUE, FLOAT_VALUE, STR_VALUE, BOOL_VALUE = range(5)
+# kinds of the keys of the dependency graph
+CELL_KEY, RANGE_KEY = 0, 1
+INT64 = (-(2**63), 2**63 - 1)
+
+Snapshot = namedtuple(
+    "Snapshot",
+    ["digest", "grid", "values", "keys", "precedents", "ranges", "shared"],
+)
+
+
+def snapshot_path(csv_filename: str) -> Path:
+    "the snapshot of a csv file is written next to it"
+    return Path(csv_filename).with_name(Path(csv_filename).name + SUFFIX)
+
+
+def file_digest(filename: str) -> bytes:
+    with open(filename, "rb") as file:
+        return hashlib.file_digest(file, "sha256").digest()
+
+
+def write_array(file, values: array) -> None:
+    file.write(struct.pack("<q", len(values) * values.itemsize))
+    values.tofile(file)
+
+
+def read_array(view: memoryview, offset: int, typecode: str) -> tuple[array, int]:
+    "copies an array out of the mapped file, in one memcpy, grids are mutable"
+    (size,) = struct.unpack_from("<q", view, offset)
+    offset += 8
+    values = array(typecode)
+    values.frombytes(view[offset : offset + size])
+    return values, offset + size
+
+
+def write_strings(file, strings: list[str]) -> None:
+    "writes strings as the end offsets of their utf-8 encodings and the encodings"
+    encoded = [string.encode() for string in strings]
+    ends, end = array("i"), 0
+    for data in encoded:
+        end += len(data)
+        ends.append(end)
+    write_array(file, ends)
+    write_array(file, array("B", b"".join(encoded)))
+
+
+def read_strings(view: memoryview, offset: int) -> tuple[list[str], int]:
+    ends, offset = read_array(view, offset, "i")
+    data, offset = read_array(view, offset, "B")
+    data, start, strings = data.tobytes(), 0, []
+    for end in ends:
+        strings.append(data[start:end].decode())
+        start = end
+    return strings, offset
+
+
+def encode_key(key) -> tuple[int, int, int, int, int]:
+    if isinstance(key, str):
+        return (CELL_KEY, *cell_index(key), 0, 0)
+    return (RANGE_KEY, *key)
+
+
+def decode_key(kind: int, a: int, b: int, c: int, d: int):
+    return cell_name(a, b) if kind == CELL_KEY else (a, b, c, d)
+
+
+def save_snapshot(variables, csv_filename: str, digest: bytes | None = None) -> None:
+    """writes the raw cells, the cached values of the formulas, the dependency
+    graph and the shared formulas of a sheet evaluated from a csv file next to it"""
+    grid = variables.grid
+    digest = digest or file_digest(csv_filename)
+    positions = sorted(grid.texts)
+
+    # cached values of the formula cells, values that can't be stored are dropped
+    kinds, ints, floats, strings = array("b"), array("q"), array("d"), []
+    for row, col in positions:
+        value = variables.cache.get(cell_name(row, col), None)
+        if isinstance(value, bool):
+            kinds.append(BOOL_VALUE)
+            ints.append(value)
+        elif isinstance(value, int) and INT64[0] <= value <= INT64[1]:
+            kinds.append(INT_VALUE)
+            ints.append(value)
+        elif isinstance(value, float):
+            kinds.append(FLOAT_VALUE)
+            floats.append(value)
+        elif isinstance(value, str):
+            kinds.append(STR_VALUE)
+            strings.append(value)
+        else:
+            kinds.append(NOT_CACHED)
+
+    # dependency graph in compressed rows: the precedents of each key
+    index: dict = {}
+    for key in chain(variables.dependents, variables.precedents, variables.ranges):
+        index.setdefault(key, len(index))
+    keys, ends, precedents = array("i"), array("i"), array("i")
+    for key in index:
+        keys.extend(encode_key(key))
+        precedents.extend(index[p] for p in variables.precedents.get(key, ()))
+        ends.append(len(precedents))
+    ranges = array("i", (index[bounds] for bounds in variables.ranges))
+
+    # shared formulas: the number of the group of each formula cell, -1 for none
+    groups: dict = {}  # id of a group -> its number and the group
+    members = array("i")
+    for position in positions:
+        if (group := variables.shared.get(position)) is None:
+            members.append(-1)
+        else:
+            members.append(groups.setdefault(id(group), (len(groups), group))[0])
+    groups = [group for _, group in groups.values()]
+    anchors = array("i", (i for group in groups for i in (group.row, group.col)))
+
+    path = snapshot_path(csv_filename)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as file:
+        byteorder = sys.byteorder.encode().ljust(8, b"\0")
+        file.write(HEADER.pack(MAGIC, VERSION, byteorder, digest, *grid.shape))
+        for col_kinds, col_numbers in zip(grid.kinds, grid.numbers):
+            write_array(file, col_kinds)
+            write_array(file, col_numbers)
+        write_array(file, array("i", (i for position in positions for i in position)))
+        write_strings(file, [grid.texts[position] for position in positions])
+        write_array(file, kinds)
+        write_array(file, ints)
+        write_array(file, floats)
+        write_strings(file, strings)
+        write_array(file, keys)
+        write_array(file, ends)
+        write_array(file, precedents)
+        write_array(file, ranges)
+        write_array(file, members)
+        write_array(file, anchors)
+        write_strings(file, [group.formula for group in groups])
+    tmp.replace(path)  # readers never see a partially written snapshot
+
+
+def read_snapshot(csv_filename: str) -> Snapshot | None:
+    "reads the snapshot of a csv file, None if there's none or it's unreadable"
+    try:
+        with open(snapshot_path(csv_filename), "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    return parse_snapshot(view)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def snapshot_digest(csv_filename: str) -> bytes | None:
+    "hash of the csv a snapshot was written for, read from its header only"
+    try:
+        with open(snapshot_path(csv_filename), "rb") as file:
+            magic, version, _, digest, *_ = HEADER.unpack(file.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return digest if (magic, version) == (MAGIC, VERSION) else None
+
+
+def parse_snapshot(view: memoryview) -> Snapshot | None:
+    magic, version, byteorder, digest, n_rows, n_cols = HEADER.unpack_from(view)
+    if (magic, version) != (MAGIC, VERSION):
+        return None
+    if byteorder.rstrip(b"\0").decode() != sys.byteorder:
+        return None  # arrays are stored in the byte order of the machine
+    offset = HEADER.size
+
+    grid = Grid()
+    for _ in range(n_cols):
+        col_kinds, offset = read_array(view, offset, "b")
+        col_numbers, offset = read_array(view, offset, "d")
+        grid.kinds.append(col_kinds)
+        grid.numbers.append(col_numbers)
+    grid.n_rows = n_rows
+    flat, offset = read_array(view, offset, "i")
+    positions = list(zip(flat[::2], flat[1::2]))
+    texts, offset = read_strings(view, offset)
+    grid.texts = dict(zip(positions, texts))
+
+    kinds, offset = read_array(view, offset, "b")
+    ints, offset = read_array(view, offset, "q")
+    floats, offset = read_array(view, offset, "d")
+    strings, offset = read_strings(view, offset)
+    ints = iter(ints)  # shared by ints and bools, stored in the same column
+    columns = {
+        INT_VALUE: ints,
+        BOOL_VALUE: ints,
+        FLOAT_VALUE: iter(floats),
+        STR_VALUE: iter(strings),
+    }
+    values = {}
+    for position, kind in zip(positions, kinds):
+        if kind != NOT_CACHED:
+            value = next(columns[kind])
+            values[position] = bool(value) if kind == BOOL_VALUE else value
+
+    flat, offset = read_array(view, offset, "i")
+    keys = [decode_key(*flat[i : i + 5]) for i in range(0, len(flat), 5)]
+    ends, offset = read_array(view, offset, "i")
+    precedents, offset = read_array(view, offset, "i")
+    ranges, offset = read_array(view, offset, "i")
+
+    members, offset = read_array(view, offset, "i")
+    anchors, offset = read_array(view, offset, "i")
+    formulas, offset = read_strings(view, offset)
+    groups = list(zip(formulas, anchors[::2], anchors[1::2]))
+    shared = {p: groups[n] for p, n in zip(positions, members) if n >= 0}
+    return Snapshot(digest, grid, values, keys, (ends, precedents), ranges, shared)
+
+
+def column(columns: list[array], col: int, typecode: str) -> array:
+    return columns[col] if col < len(columns) else array(typecode)
+
+
+def changed_cells(old: Grid, new: Grid) -> list[tuple[int, int]]:
+    "positions of the cells that differ between two grids"
+    changed = {p for p, raw in old.texts.items() if new.texts.get(p) != raw}
+    changed.update(p for p in new.texts if p not in old.texts)
+    for col in range(max(len(old.kinds), len(new.kinds))):
+        old_kinds, new_kinds = column(old.kinds, col, "b"), column(new.kinds, col, "b")
+        if (
+            old_kinds == new_kinds
+            and column(old.numbers, col, "d") == column(new.numbers, col, "d")
+        ):
+            continue  # compared in bulk, most columns of an edited sheet are equal
+        for row in range(max(len(old_kinds), len(new_kinds))):
+            if old[row, col] != new[row, col]:
+                changed.add((row, col))
+    return sorted(changed)
+
+
+def restore_snapshot(variables, snapshot: Snapshot) -> None:
+    """restores the raw cells, the cached values, the dependency graph and the
+    shared formulas of a sheet, each formula of a group is parsed once"""
+    variables.grid = snapshot.grid
+    keys, (ends, precedents) = snapshot.keys, snapshot.precedents
+    start = 0
+    for key, end in zip(keys, ends):
+        for i in precedents[start:end]:
+            variables.link(keys[i], key)
+        start = end
+    variables.ranges.update(keys[i] for i in snapshot.ranges)
+    groups = {group: shared_group(*group) for group in set(snapshot.shared.values())}
+    variables.shared = {
+        position: groups[group]
+        for position, group in snapshot.shared.items()
+        if groups[group] is not None
+    }
+    for (row, col), value in snapshot.values.items():
+        variables.cache[cell_name(row, col)] = value
@@ -0,0 +1,98 @@
+import csv
+from collections import deque
+from collections.abc import Mapping
+from parser import references
+from typing import Iterator
+
+from grid import FLOAT, INT, classify
+from interpreter import formula_resolver, parse_formula
+from utils import cell_index, cell_name
+
+STREAM_WINDOW = 1000  # max number of previous rows kept in memory
+
+
+class RowWindow(Mapping):
+    "evaluated values of the last rows of a sheet that is read row by row"
+
+    def __init__(self) -> None:
+        self.values: dict[str, object] = {}
+        self.pending: dict[str, str] = {}  # raw cells of the current row
+        self.rows: deque[list[str]] = deque()  # cell names of each row kept
+
+    def __getitem__(self, key: str):
+        if "$" in key:
+            key = key.replace("$", "")
+        if key in self.values:
+            return self.values[key]
+        if key not in self.pending:
+            return ""  # empty cell
+
+        raw = self.pending.pop(key)
+        kind, number = classify(raw)
+        if kind == INT:
+            value = int(number)
+        elif kind == FLOAT:
+            value = number
+        else:
+            raw = raw.lstrip("=")
+            value = formula_resolver(raw, variables=self) if raw else ""
+        self.values[key] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def push(self, names: list[str], row: list[str]) -> None:
+        "add the raw cells of a new row, evaluated when first read"
+        self.pending.update(zip(names, row))
+        self.rows.append(names)
+
+    def evict(self) -> None:
+        "drop the oldest row kept in the window"
+        for name in self.rows.popleft():
+            self.values.pop(name, None)
+
+
+def read_rows(filename: str) -> Iterator[list[str]]:
+    with open(filename) as csv_file:
+        for row in csv.reader(csv_file):
+            yield [cell.strip() for cell in row]
+
+
+def scan_csv(filename: str) -> tuple[int, int, int]:
+    """returns the number of columns of a csv and how far back and forward (in
+    rows) its formulas reach, without keeping the rows in memory"""
+    n_cols = back = forward = 0
+    for row_num, row in enumerate(read_rows(filename)):
+        n_cols = max(n_cols, len(row))
+        for raw in row:
+            if classify(raw)[0] in (INT, FLOAT) or not (raw := raw.lstrip("=")):
+                continue
+            for start, stop in references(parse_formula(raw)):
+                rows = (cell_index(start)[0], cell_index(stop)[0])
+                back = max(back, row_num - min(rows))
+                forward = max(forward, max(rows) - row_num)
+    return n_cols, back, forward
+
+
+def stream_csv(filename: str, n_cols: int, back: int) -> Iterator[str]:
+    """evaluates a csv row by row, yielding each output line as soon as its row
+    is evaluated. only the last `back` rows are kept to resolve references"""
+    window = RowWindow()
+    blank_rows = 0  # like csv2variables, trailing empty lines are not output
+
+    for row_num, row in enumerate(read_rows(filename)):
+        cells = [cell_name(row_num, col) for col in range(n_cols)]
+        window.push(cells, row)
+        if not row:
+            blank_rows += 1
+        else:
+            empty_line = ",".join([""] * n_cols) + "\n"
+            yield from (empty_line for _ in range(blank_rows))
+            blank_rows = 0
+            yield ",".join(f"{window[cell]}" for cell in cells) + "\n"
+        if len(window.rows) > back:
+            window.evict()
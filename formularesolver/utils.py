@@ -1,17 +1,9 @@
 import re
 import string
-from itertools import chain, dropwhile, product, takewhile
+from itertools import count
 from typing import Iterator
 
-from lexer import LParenthesis, Token, get_precedence
-
-
-def needs_swap(left_token: Token, right_token: Token) -> bool:
-    "evaluates if the right token has higher precedence than the left token -- aka if a node swap is needed"
-    assert left_token.type == "operator"
-    if right_token.type in ("operator", "function", "symbol"):
-        return get_precedence(left_token) > get_precedence(right_token)
-    return False
+from lexer import Token
 
 
 def parse_parenthesis_expr(tokens: Iterator[Token]) -> Iterator[Token]:
@@ -58,32 +50,114 @@ def parse_function_args(tokens: Iterator[Token]) -> list[list[Token]]:
     return list(split_args(args))  # need to consume iterator here
 
 
+MAX_COLUMNS = 16384  # A...XFD, the columns of a excel sheet
+RE_CELL = re.compile(r"\$?([A-Z]+)\$?([0-9]+)").fullmatch
+RE_CELL_PARTS = re.compile(r"(\$?)([A-Z]+)(\$?)([0-9]+)").fullmatch
+
+
+def base26_index(column: str) -> int:
+    "zero based index of a column name computed in base 26, A -> 0, AA -> 26"
+    index = 0
+    for char in column:
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def base26_name(index: int) -> str:
+    "column name of a zero based index computed in base 26, 0 -> A, 26 -> AA"
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = string.ascii_uppercase[remainder] + name
+    return name
+
+
+# lookup tables for the columns of a excel sheet
+COLUMN_NAMES: tuple[str, ...] = tuple(map(base26_name, range(MAX_COLUMNS)))
+COLUMN_INDICES: dict[str, int] = {name: i for i, name in enumerate(COLUMN_NAMES)}
+
+
+def column_index(column: str) -> int:
+    "zero based index of a column name, A -> 0, Z -> 25, AA -> 26"
+    index = COLUMN_INDICES.get(column)
+    return index if index is not None else base26_index(column)
+
+
+def column_name(index: int) -> str:
+    "column name of a zero based index, 0 -> A, 25 -> Z, 26 -> AA"
+    return COLUMN_NAMES[index] if 0 <= index < MAX_COLUMNS else base26_name(index)
+
+
 def alphabetical_generator() -> Iterator[str]:
     "sequence A,B,C...Z,AA,AB"
-    for letter in string.ascii_uppercase:
-        yield letter
-
-    for letter in alphabetical_generator():
-        for letter_suffix in string.ascii_uppercase:
-            yield letter + letter_suffix
+    return map(column_name, count())
 
 
 def arange(start: str, stop: str) -> Iterator[str]:
     "range function for sequence  A,B,C...Z,AA,AB"
-    _range = alphabetical_generator()
-    _range = dropwhile(lambda x: x != start, _range)
-    _range = takewhile(lambda x: x != stop, _range)
-    return chain(_range, [stop])
+    return map(column_name, range(column_index(start), column_index(stop) + 1))
 
 
-def excel_range(start: str, stop: str) -> Iterator[str]:
-    "returns all cell in a excel range"
-    mstart, mstop = re.match(r"([A-Z]+)(\d+)", start), re.match(r"([A-Z]+)(\d+)", stop)
-    assert mstart and mstop, ValueError("bad excel range")
+def cell_index(cell: str) -> tuple[int, int]:
+    "zero based (row, col) of a excel cell, absolute references are accepted"
+    m = RE_CELL(cell)
+    if m is None or int(m.group(2)) < 1:
+        raise ValueError(f"invalid cell reference: {cell!r}")
+    return int(m.group(2)) - 1, column_index(m.group(1))
+
+
+def cell_name(row: int, col: int) -> str:
+    "excel name of a zero based (row, col) cell"
+    return column_name(col) + str(row + 1)
+
+
+def shift_cell(cell: str, rows: int, cols: int) -> str:
+    "moves a cell reference by a offset, its absolute ($) parts don't move"
+    col_absolute, column, row_absolute, row = RE_CELL_PARTS(cell).groups()
+    if not col_absolute:
+        column = column_name(column_index(column) + cols)
+    if not row_absolute:
+        row = str(int(row) + rows)
+    return col_absolute + column + row_absolute + row
+
+
+def relative_cell(cell: str, row: int, col: int) -> str:
+    "R1C1 notation of a cell reference seen from the zero based (row, col) cell"
+    col_absolute, column, row_absolute, ref_row = RE_CELL_PARTS(cell).groups()
+    ref_col = column_index(column)
+    r = f"R{ref_row}" if row_absolute else f"R[{int(ref_row) - 1 - row}]"
+    c = f"C{ref_col + 1}" if col_absolute else f"C[{ref_col - col}]"
+    return r + c
 
-    start_col, start_row = re.match(r"([A-Z]+)(\d+)", start).groups()
-    stop_col, stop_row = re.match(r"([A-Z]+)(\d+)", stop).groups()
 
-    num_range = map(str, range(int(start_row), int(stop_row) + 1))
-    alpha_range = arange(start_col, stop_col)
-    return (a + b for (a, b) in product(alpha_range, num_range))
+def range_bounds(start: str, stop: str) -> tuple[int, int, int, int]:
+    "zero based (row0, col0, row1, col1) of the top left and bottom right cells"
+    (start_row, start_col), (stop_row, stop_col) = cell_index(start), cell_index(stop)
+    return (
+        min(start_row, stop_row),
+        min(start_col, stop_col),
+        max(start_row, stop_row),
+        max(start_col, stop_col),
+    )
+
+
+def in_bounds(bounds: tuple[int, int, int, int], row: int, col: int) -> bool:
+    "whether the cell at (row, col) is inside the bounds of a range"
+    return bounds[0] <= row <= bounds[2] and bounds[1] <= col <= bounds[3]
+
+
+def bounds_cells(bounds: tuple[int, int, int, int]) -> Iterator[str]:
+    "names of the cells inside the bounds of a range, column by column"
+    row0, col0, row1, col1 = bounds
+    rows = [str(row) for row in range(row0 + 1, row1 + 2)]
+    return (
+        column + row
+        for column in map(column_name, range(col0, col1 + 1))
+        for row in rows
+    )
+
+
+def excel_range(start: str, stop: str) -> Iterator[str]:
+    "returns all cell in a excel range, column by column"
+    return bounds_cells(range_bounds(start, stop))
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+from snapshot import snapshot_path
+
+
+class CsvFiles:
+    "mixin of test cases writing csv files, removed with their snapshots after each test"
+
+    def write_csv(self, content: str, filename: str | None = None) -> str:
+        "writes a csv file, a new temporary one unless given a filename"
+        if filename is None:
+            fd, filename = tempfile.mkstemp(suffix=".csv")
+            os.close(fd)
+            self.addCleanup(os.remove, filename)
+            self.addCleanup(snapshot_path(filename).unlink, missing_ok=True)
+        with open(filename, "w") as csv_file:
+            csv_file.write(content)
+        return filename
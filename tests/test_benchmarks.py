@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks import sheets
+from benchmarks.run import BENCHMARKS, compare, run_benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_sheets(self):
+        sums = ["=SUM(A1:A2)", "=SUM(B1:B2)", "=SUM(C1:C2)"]
+        assert sheets.wide(3, n_rows=2)[-1] == sums
+        assert sheets.chain(3) == [["1"], ["=A1 + 1"], ["=A2 + 1"]]
+        assert len(sheets.tall(10)) == 10
+        assert sheets.ranges(2, window=3)[1][1:] == ["=SUM(A2:A4) / MAX(A2:A4)"]
+        assert sheets.blocks(2, n_cols=3, window=4)[1] == ["1", "2", "3", "=SUM(A2:C5)"]
+        assert sheets.long_formula(4).count(" + ") == 3
+
+    def test_benchmarks_run(self):
+        results = run_benchmarks(list(BENCHMARKS), scale=0.01, repeat=1)
+        assert set(results) == set(BENCHMARKS)
+        assert all(seconds > 0 for seconds in results.values())
+
+    def test_compare(self):
+        baseline = {"lexer": 1.0, "parser": 1.0, "removed": 1.0}
+        results = {"lexer": 1.2, "parser": 1.3, "added": 5.0}
+        assert compare(results, baseline, 0.25) == ["parser: 1.000000s -> 1.300000s"]
+        assert compare(results, baseline, 0.5) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
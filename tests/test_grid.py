@@ -0,0 +1,58 @@
+import unittest
+from array import array
+
+from grid import EMPTY, FLOAT, INT, TEXT, Grid, classify
+
+
+class TestGrid(unittest.TestCase):
+    def test_classify(self):
+        assert classify("") == (EMPTY, 0.0)
+        assert classify("12") == (INT, 12.0)
+        assert classify("-3") == (INT, -3.0)
+        assert classify("1.5") == (FLOAT, 1.5)
+        # non canonical numbers are kept as text so the raw cell round trips
+        for raw in ("0001", "1.50", "1e3", "+1", "1_000", "=1", "foo", str(2**60)):
+            assert classify(raw)[0] == TEXT, raw
+
+    def test_set_and_get(self):
+        grid = Grid()
+        grid[0, 0] = "1"
+        grid[2, 1] = "2.5"
+        grid[1, 3] = "=SUM(A1:A2)"
+        assert grid.shape == (3, 4)
+        assert (grid[0, 0], grid[2, 1], grid[1, 3], grid[5, 5]) == (
+            "1",
+            "2.5",
+            "=SUM(A1:A2)",
+            "",
+        )
+        assert grid.cell(0, 0) == 1 and isinstance(grid.cell(0, 0), int)
+        assert grid.cell(2, 1) == 2.5
+        assert list(grid) == [(0, 0), (1, 3), (2, 1)]
+        assert len(grid) == 3
+
+        grid[1, 3] = "4"
+        assert grid.texts == {}
+        del grid[0, 0]
+        assert (0, 0) not in grid
+        assert len(grid) == 2
+
+    def test_numeric_block(self):
+        grid = Grid()
+        for row in range(4):
+            grid[row, 0] = str(row)
+            grid[row, 1] = str(row + 10)
+            grid[row, 2] = f"{row}.5"
+        kind, slices = grid.numeric_block(0, 0, 3, 1)
+        assert kind == INT
+        assert slices == [array("d", [0, 1, 2, 3]), array("d", [10, 11, 12, 13])]
+        assert grid.numeric_block(1, 2, 2, 2) == (FLOAT, [array("d", [1.5, 2.5])])
+        # mixed kinds, out of bounds and formulas are not numeric blocks
+        assert grid.numeric_block(0, 1, 0, 2) is None
+        assert grid.numeric_block(0, 0, 9, 0) is None
+        grid[2, 0] = "=A1"
+        assert grid.numeric_block(0, 0, 3, 0) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,15 @@
 import unittest
+from array import array
+from functools import partial
+from parser import parser
+from unittest import mock
 
-from interpreter import formula_resolver
+import interpreter as interpreter_module
+from interpreter import (FUNCTIONS, RangeRef, compile_ast, compile_formula,
+                         evaluate_value, formula_resolver,
+                         formula_resolver_many, interpreter, parse_formula,
+                         reduce_column, to_column)
+from lexer import lexer
 
 TEST_VARIABLES = {
     "A1": 1,
@@ -123,6 +132,164 @@ class TestInterpreter(unittest.TestCase):
             result = formula_resolver(expr, TEST_VARIABLES)
             assert result == expected, (expr, result)
 
+    def test_variable_operands(self):
+        assert formula_resolver("A1 + B1 * 2", TEST_VARIABLES) == 5
+        assert formula_resolver("-B1 + SUM(A1:A5)", TEST_VARIABLES) == 3
+
+    def test_ast_is_reusable(self):
+        ast = parse_formula("SUM(A1:A5) + MAX(B1:B10) * 2")
+        first = interpreter(ast, TEST_VARIABLES).value
+        second = interpreter(ast, TEST_VARIABLES).value
+        assert first == second == 9
+
+    def test_formula_cache(self):
+        compile_formula.cache_clear()
+        for _ in range(100):
+            formula_resolver("MAX(A1:B1)", TEST_VARIABLES)
+        info = compile_formula.cache_info()
+        assert (info.hits, info.misses) == (99, 1), info
+
+    def test_range_columns(self):
+        column = to_column([1, 2, 3])
+        assert list(column) == [1, 2, 3]
+        assert to_column([1, "a"]) == [1, "a"]
+        assert to_column([1, 2.0]) == [1, 2.0]
+        assert to_column([2**70, 1]) == [2**70, 1]
+
+        with mock.patch.object(interpreter_module, "numpy", None):
+            assert to_column([1, 2]) == array("q", [1, 2])
+            assert to_column([1.5, 2.5]) == array("d", [1.5, 2.5])
+            assert formula_resolver("SUM(A1:B10)", TEST_VARIABLES) == 30
+
+    def test_int_sums_dont_overflow(self):
+        for column in (to_column([2**62, 2**62]), to_column([2**62] * 3 + [-(2**62)])):
+            assert reduce_column(column, sum) == 2**63, column
+        assert reduce_column(to_column([2**62, 2**62]), max) == 2**62
+        assert reduce_column(to_column([2**62, -(2**62), 5]), sum) == 5
+
+    def test_range_refs_are_lazy(self):
+        variables = mock.MagicMock(wraps=TEST_VARIABLES)
+        del variables.range_values, variables.reduce_range
+        ref = formula_resolver("B2:A1", variables)
+        assert isinstance(ref, RangeRef)
+        assert (ref.bounds, len(ref), repr(ref)) == ((0, 0, 1, 1), 4, "A1:B2")
+        variables.get.assert_not_called()
+        assert list(ref) == [1, 1, 2, 2]
+        assert ref.reduce(max) == 2
+
+    def test_range_cells_are_built_once(self):
+        interpreter_module.range_cells.cache_clear()
+        for _ in range(3):
+            assert formula_resolver("SUM(A1:A10)", TEST_VARIABLES) == 10
+            assert formula_resolver("MAX(A1:B2)", TEST_VARIABLES) == 2
+        info = interpreter_module.range_cells.cache_info()
+        assert (info.misses, info.hits) == (2, 4), info
+
+    def test_aggregates_mix_ranges_and_scalars(self):
+        assert formula_resolver("SUM(A1:A5, 10, B1:B2)", TEST_VARIABLES) == 19
+        assert formula_resolver("MAX(A1:A5, 0)", TEST_VARIABLES) == 1
+        assert formula_resolver("MIN(B1:B10, A1)", TEST_VARIABLES) == 1
+        assert formula_resolver("SUM(1, 2, 3)") == 6
+
+    def test_functions_are_bound_when_parsed(self):
+        ast = parse_formula("ROUND(SUM(A1:A5) / 3, 2)")
+        assert ast.function is FUNCTIONS["ROUND"]
+        assert ast.children[0].function is FUNCTIONS["/"]
+        assert ast.children[0].children[0].children[0].function.needs_refs
+        assert FUNCTIONS["SUM"].vectorizable and not FUNCTIONS[":"].pure
+        assert formula_resolver("IF(FALSE, 1)") is False
+        assert formula_resolver("LOG(8, 2)") == 3
+
+        for expr in ("PI(1)", "NOT(1, 2)", "IF(TRUE)", "SUM(A1:(B2))"):
+            self.assertRaises(SyntaxError, parse_formula, expr)
+
+        # functions are bound on first use in the ASTs straight from the parser
+        ast = parser(lexer("ROUND(SUM(A1:A5) / 3, 2) + IF(A1, 1, 2)"))
+        assert interpreter(ast, TEST_VARIABLES).value == 2.67
+        assert ast.function is FUNCTIONS["+"]
+        ast = parser(lexer("1 + NOT(1, 2)"))
+        self.assertRaises(SyntaxError, interpreter, ast, TEST_VARIABLES)
+        self.assertRaises(SyntaxError, compile_ast, ast)
+
+    def test_vectorizable_functions(self):
+        ref = RangeRef((0, 0, 1, 0), {"A1": 1, "A2": 2})
+        assert FUNCTIONS["SUM"].fn(ref, 3) == 6
+        assert FUNCTIONS["MAX"].fn(ref, 0) == 2 and FUNCTIONS["MIN"].fn(3, ref) == 1
+        assert not FUNCTIONS["ROUND"].vectorizable and FUNCTIONS["ROUND"].fn is round
+
+    def test_lazy_functions(self):
+        class Variables(dict):
+            def __getitem__(self, key):
+                reads.append(key)
+                return super().__getitem__(key)
+
+        variables = Variables(A1=1, B1=0, C1="x")
+        for expr, expected, read in (
+            ("IF(A1, 2, SUM(A1:A3) / B1)", 2, ["A1"]),
+            ("IF(B1, C1 + 1, A1)", 1, ["B1", "A1"]),
+            ("AND(B1, C1 + 1)", False, ["B1"]),
+            ("OR(A1, C1 + 1)", True, ["A1"]),
+            ("IFERROR(A1 / B1, C1)", "x", ["A1", "B1", "C1"]),
+            ("IFERROR(C1 + 1, -1)", -1, ["C1"]),
+            ("IFERROR(A1, C1)", 1, ["A1"]),
+            ("CHOOSE(A1 + 1, C1, B1, 1 / 0)", 0, ["A1", "B1"]),
+        ):
+            ast = parse_formula(expr)
+            for evaluate in (compile_ast(ast), partial(evaluate_value, ast)):
+                reads = []
+                result = evaluate(variables)
+                assert (result, reads) == (expected, read), (expr, result, reads)
+
+        assert formula_resolver("IF(1 > 2, 1)") is False
+        assert formula_resolver("LOG10(100) + IFERROR(1 / 0, 1)") == 3
+        self.assertRaises(ValueError, formula_resolver, "CHOOSE(3, 1, 2)")
+
+    def test_compiled_matches_interpreter(self):
+        expressions = (
+            self.MATH_EXPRESSIONS
+            + self.LOGICAL_OPERATORS
+            + self.FUNCTION_EXPR
+            + self.MISC_EXPR
+            + self.RANGE_EXPR
+        )
+        for expr, expected in expressions:
+            ast = parse_formula(expr)
+            compiled = compile_ast(ast)(TEST_VARIABLES)
+            interpreted = interpreter(ast, TEST_VARIABLES).value
+            assert compiled == interpreted == expected, (expr, compiled, interpreted)
+
+    def test_long_formulas(self):
+        # 100k tokens, far deeper than the recursion limit
+        assert formula_resolver(" + ".join(["1"] * 50_000)) == 50_000
+        expr = " - ".join(["A1 * 2"] * 25_000)
+        variables = {"A1": 1}
+        assert formula_resolver(expr, variables) == 2 - 2 * 24_999
+        assert interpreter(parse_formula(expr), variables).value == 2 - 2 * 24_999
+        expr = "(" * 10_000 + "A1 + 1" + ")" * 10_000 + " / 2"
+        assert formula_resolver(expr, variables) == 1
+        assert interpreter(parse_formula(expr), variables).value == 1
+
+    def test_formula_resolver_many(self):
+        pairs = [("A1 + 1", {"A1": n}) for n in range(5)] + [("PI() * 0", None)]
+        expected = [formula_resolver(expr, variables) for expr, variables in pairs]
+        assert list(formula_resolver_many(pairs)) == expected == [1, 2, 3, 4, 5, 0]
+        bindings = [{"A1": n, "A2": 2} for n in range(5)]
+        assert list(formula_resolver_many("SUM(A1:A2)", bindings)) == [2, 3, 4, 5, 6]
+        assert list(formula_resolver_many([])) == []
+        # missing variables are empty, as for formula_resolver
+        for refs in (
+            formula_resolver_many("A1:B1", [None, {}]),
+            formula_resolver_many([("A1:B1", None), ("A1:B1", {})]),
+        ):
+            assert [list(ref) for ref in refs] == [[None, None]] * 2
+
+        with mock.patch.object(interpreter_module, "BATCH_SIZE", 2):
+            assert list(formula_resolver_many(iter(pairs), jobs=2)) == expected
+            results = formula_resolver_many("SUM(A1:A2)", bindings, jobs=2)
+            assert list(results) == [2, 3, 4, 5, 6]
+            results = formula_resolver_many("A1 * 0 + 1", [None, {"A1": 2}], jobs=2)
+            self.assertRaises(KeyError, list, results)  # as in formula_resolver
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
-from lexer import Token, lexer
+from interpreter import formula_resolver
+from lexer import SyntaxError, Token, lexer
 
 ONE = Token("constant", 1)
 SUM = Token("function", "SUM")
@@ -39,10 +40,45 @@ class TestLexer(unittest.TestCase):
         assert "variable" == next(lexer("AB12")).type
         assert "variable" != next(lexer('"AB12"')).type
 
+    def test_columns_named_like_functions(self):
+        for cell in ("IF1", "SUM$2", "$PI3", "SUMA4", "LOG101"):
+            assert [("variable", cell)] == list(lexer(cell)), cell
+        assert [("function", "LOG10"), ("symbol", "(")] == list(lexer("LOG10("))
+        assert [token.type for token in lexer("SUM(IF1:IF9) + PI()")] == [
+            "function",
+            "symbol",
+            "variable",
+            "operator",
+            "variable",
+            "symbol",
+            "operator",
+            "function",
+            "symbol",
+            "symbol",
+        ]
+        assert formula_resolver("SUM(IF1, SUM$2)", {"IF1": 1, "SUM$2": 2}) == 3
+
     def test_string_parsing(self):
         assert [FOO, BAR] == list(lexer('"foo" "bar"'))
         assert [FOO, ONE, BAR, BAR] == list(lexer('"foo" 1 "bar" "bar"'))
 
+    def test_long_expression(self):
+        tokens = list(lexer(" + ".join(["1"] * 50_000)))
+        assert len(tokens) == 99_999
+        assert tokens[0] == tokens[-1] == ONE
+        assert tokens[1] == PLUS
+
+    def test_interned_tokens(self):
+        first, second = list(lexer("SUM(A1) + SUM(A1)")), list(lexer("SUM(A1)+1"))
+        assert first[0] is first[5] is second[0]  # functions
+        assert first[1] is first[6] is second[1]  # symbols
+        assert first[4] is second[4]  # operators
+        assert first[2] == first[7] and first[2] is not first[7]  # variables
+
+    def test_invalid_token_offset(self):
+        with self.assertRaisesRegex(SyntaxError, r"position 4: \?2"):
+            list(lexer("1 + ?2"))
+
 
 if __name__ == "__main__":
     unittest.main()
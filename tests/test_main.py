@@ -0,0 +1,16 @@
+import unittest
+
+from main import variables2csv
+from sheet import Variables
+
+
+class TestMain(unittest.TestCase):
+    def test_variables2csv(self):
+        variables = Variables(
+            {"A1": "1", "B1": "=SUM(A1:A1) + 1", "A2": "=MAX(A1:B1) * 2", "B2": ""}
+        )
+        assert "".join(variables2csv(variables)) == "1,2\n4,\n"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import math
+import threading
+import time
+import unittest
+from parser import ConstantNode, FunctionNode
+
+from interpreter import compile_formula, formula_resolver, parse_formula
+from optimizer import evaluated_nodes, shared_subtrees
+
+
+class TestOptimizer(unittest.TestCase):
+    def test_constant_folding(self):
+        for expr, expected in (
+            ("1 + 2 * 3", 7),
+            ("COS(2 * PI())", math.cos(2 * math.pi)),
+            ("(((3 + 2)))", 5),
+            ('"foo" & "bar"', "foobar"),
+            ("SUM(1, 2, 3) > 5", True),
+        ):
+            ast = parse_formula(expr)
+            assert isinstance(ast, ConstantNode), expr
+            assert ast.value == expected, (expr, ast.value)
+
+        # only the constant part of the formula is folded
+        ast = parse_formula("A1 * (2 + 3)")
+        assert evaluated_nodes(ast) == 3
+        assert ast.children[1].value == 5
+
+    def test_errors_are_not_folded(self):
+        ast = parse_formula("1 / 0")
+        assert isinstance(ast, FunctionNode)
+        self.assertRaises(ZeroDivisionError, formula_resolver, "1 / 0")
+
+    def test_common_subexpressions(self):
+        ast = parse_formula("(A1 + B1) * (A1 + B1) + SUM(A1:A3) / SUM(A1:A3)")
+        left, right = ast.children
+        assert left.children[0] is left.children[1]
+        assert right.children[0] is right.children[1]
+        # small subtrees are cheaper to evaluate again
+        assert [node.value for node in shared_subtrees(ast)] == ["SUM"]
+        assert evaluated_nodes(ast) == 9  # 19 nodes before optimization
+        # 1 and 1.0 are different constants
+        ast = parse_formula("A1 + 1 + (A1 + 1.0)")
+        assert ast.children[0] is not ast.children[1]
+        # and so are 0.0 and -0.0
+        formula = "IF(A1, 0.5 * 0, -0.5 * 0)"
+        ast = parse_formula(formula)
+        assert ast.children[1] is not ast.children[2]
+        assert math.copysign(1, formula_resolver(formula, {"A1": 0})) == -1
+
+    def test_shared_subtrees_are_evaluated_once(self):
+        formula = "A1 + (B1 * 2 + 1) + (B1 * 2 + 1)"
+        calls = []
+
+        class Variables(dict):
+            def __getitem__(self, key):
+                calls.append(key)
+                if key == "A1":
+                    # evaluates the same compiled formula for another cell
+                    return formula_resolver(formula, {"A1": 0, "B1": 1})
+                return super().__getitem__(key)
+
+        compile_formula.cache_clear()
+        assert formula_resolver(formula, Variables(B1=10)) == 6 + 21 + 21
+        assert calls == ["A1", "B1"]
+
+    def test_shared_subtrees_in_threads(self):
+        formula = "(A1 * 2 + 1) * (A1 * 2 + 1)"
+        first_reading, second_reading = threading.Event(), threading.Event()
+
+        class Variables(dict):
+            def __getitem__(self, key):
+                self.reads += 1
+                if self.reads == 1:
+                    self.wait()  # the other thread starts evaluating meanwhile
+                return super().__getitem__(key)
+
+        first, second = Variables(A1=1), Variables(A1=10)
+        first.reads = second.reads = 0
+        first.wait = lambda: (first_reading.set(), second_reading.wait(5))
+        second.wait = lambda: (second_reading.set(), time.sleep(0.1))
+
+        compile_formula.cache_clear()
+        results = {}
+        thread = threading.Thread(
+            target=lambda: results.update(first=formula_resolver(formula, first))
+        )
+        thread.start()
+        first_reading.wait(5)
+        results["second"] = formula_resolver(formula, second)
+        thread.join()
+        assert results == {"first": 3 * 3, "second": 21 * 21}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
-from parser import FunctionNode, parser
+from parser import FunctionNode, parser, references
 
+from interpreter import formula_resolver
 from lexer import lexer
 
 
@@ -167,6 +168,62 @@ class TestParser(unittest.TestCase):
         assert ast.value == "%"
         assert ast[0].value == ":"
 
+    def test_left_associativity(self):
+        expr = "1 ^ 2 ^ 3"
+        ast = parser(lexer(expr))
+        assert ast.value == "^"
+        assert ast[0].value == "^"
+        assert ast[1].value == 3
+
+        expr = "- 2 ^ 2"
+        ast = parser(lexer(expr))
+        assert ast.value == "^"
+        assert ast[0].value == "unary -"
+
+    def test_deep_expressions(self):
+        expr = "(" * 5000 + "1" + ")" * 5000
+        ast = parser(lexer(expr))
+        assert ast.value == "("
+        assert formula_resolver(expr) == 1
+
+        expr = " + ".join(["1"] * 10_000)
+        ast = parser(lexer(expr))
+        assert ast.value == "+"
+        assert ast[1].value == 1
+        assert formula_resolver(expr) == 10_000
+
+        expr = "(" * 5000 + " * ".join(["A1"] * 5000) + ")" * 5000
+        assert formula_resolver(expr, {"A1": 1}) == 1
+
+    def test_function_errors(self):
+        for expr in ("SUM 1", "(1, 2)", "1, 2", "SUM(1 +)", "()", "1 2"):
+            tokens = iter(lexer(expr))
+            self.assertRaises(SyntaxError, parser, tokens)
+
+        expr = "PI()"
+        ast = parser(lexer(expr))
+        assert ast.value == "PI"
+        assert len(ast) == 0
+
+    def test_compact_nodes(self):
+        ast = parser(lexer("-A1 + SUM(B1, 2)"))
+        assert not hasattr(ast, "__dict__")
+        assert ast.token == ("operator", "+") and ast.type == "operator"
+        assert ast[0].value == "unary -" and ast[0][0].children == ()
+        values = ["+", "unary -", "A1", "SUM", "B1", 2]
+        assert [token.value for token in ast.walk()] == values
+
+    def test_references(self):
+        expr = "SUM(A1:B2) + IF(C3, $D$4, 1) * MAX(E1:E9, F1)"
+        refs = list(references(parser(lexer(expr))))
+        assert refs == [
+            ("A1", "B2"),
+            ("C3", "C3"),
+            ("$D$4", "$D$4"),
+            ("E1", "E9"),
+            ("F1", "F1"),
+        ]
+
 
 if __name__ == "__main__":
     unittest.main()
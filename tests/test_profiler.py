@@ -0,0 +1,47 @@
+import unittest
+
+from profiler import Profiler
+from sheet import Variables
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profile_sheet(self):
+        variables = Variables(
+            {
+                "A1": "1",
+                "A2": "2",
+                "B1": "=A1 * 2",
+                "B2": "=A2 * 2",
+                "C1": "=SUM(B1:B2) + IF(A1 > 0, 1, MAX(A1:A2))",
+            }
+        )
+        variables.share_formulas()
+        profiler = variables.profiler = Profiler()
+        assert variables["C1"] == 7
+
+        assert set(profiler.cells) == {"B1", "B2", "C1"}
+        assert profiler.cells["B2"].formula == "A2 * 2 (shared)"
+        assert profiler.cells["C1"].lex > 0 and profiler.cells["B2"].lex == 0
+        assert (profiler.formula_hits, profiler.formula_misses) == (1, 2)
+        assert profiler.depths["C1"] == 4  # C1 <- B1:B2 <- B1 <- A1
+        # the untaken branch of IF is never called
+        assert profiler.calls == {"*": 2, "+": 1, "SUM": 1, ":": 1, "IF": 1, ">": 1}
+        assert [cell for cell, _ in profiler.top(3)][0] == "C1"
+
+        assert variables["C1"] == 7
+        # B1 and B2 are evaluated before C1 and read by it through its range,
+        # A1 is read twice and C1 once more
+        assert profiler.cache_hits == 4
+        report = profiler.report(2)
+        assert "max dependency depth: 4" in report
+        assert "SUM(B1:B2) + IF(A1 > 0, 1, MAX(A1:A2))" in report
+
+    def test_profile_long_formula(self):
+        variables = Variables({"A1": "1", "B1": "=" + " + ".join(["A1"] * 50_000)})
+        profiler = variables.profiler = Profiler()
+        assert variables["B1"] == 50_000
+        assert profiler.calls == {"+": 49_999}
+
+
+if __name__ == "__main__":
+    unittest.main()
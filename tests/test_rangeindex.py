@@ -0,0 +1,150 @@
+import random
+import unittest
+
+from grid import Grid
+from rangeindex import RangeIndex
+from sheet import Variables
+from utils import cell_name
+
+
+class TestRangeIndex(unittest.TestCase):
+    def test_sum(self):
+        grid = Grid()
+        for row in range(10):
+            grid[row, 0] = str(row)
+            grid[row, 1] = str(row + 0.5)
+        grid[3, 2] = "=A1"
+        index = RangeIndex(grid)
+        assert index.sum((0, 0, 9, 0)) == 45 and type(index.sum((0, 0, 9, 0))) is int
+        assert index.sum((2, 0, 4, 1)) is None  # floats
+        assert index.sum((5, 1, 5, 1)) is None
+        assert index.sum((0, 0, 3, 2)) is None  # a formula
+        assert index.sum((0, 0, 10, 0)) is None  # a empty cell
+        assert index.reduce((0, 0, 9, 0), len) is None
+
+        grid[1, 0] = "100"
+        index.update(1, 0)
+        assert len(index.table) == 2  # only the sums above the cell are kept
+        assert index.sum((0, 0, 9, 0)) == 144
+        assert index.sum((2, 0, 9, 0)) == 44
+
+        # a cell right of the table, it's built again over the new columns
+        grid[0, 3] = "7"
+        index.update(0, 3)
+        assert index.table is None
+        assert index.sum((0, 3, 0, 3)) == 7 and index.table.width == 4
+
+    def test_rectangles(self):
+        grid = Grid()
+        for row in range(6):
+            for col in range(5):
+                grid[row, col] = str(row * 10 + col - 20)
+        index = RangeIndex(grid)
+        for row0 in range(6):
+            for row1 in range(row0, 6):
+                for col0 in range(5):
+                    for col1 in range(col0, 5):
+                        expected = sum(
+                            grid.cell(r, c)
+                            for r in range(row0, row1 + 1)
+                            for c in range(col0, col1 + 1)
+                        )
+                        assert index.sum((row0, col0, row1, col1)) == expected
+        assert len(index.table) == 7  # a row of zeros above the first one
+
+    def test_float_sums_match_the_sheet(self):
+        # floats are summed as without the index, rounded in the same order
+        cells = {cell_name(row, 0): str(row * 0.499 + 0.01) for row in range(100)}
+        cells.update({"B1": "=SUM(A1:A100)", "B2": "=SUM(A2:A100) + A1"})
+        indexed, plain = Variables(cells), Variables(cells)
+        indexed.range_index = RangeIndex(indexed.grid)
+        assert indexed.range_index.sum((0, 0, 99, 0)) is None
+        assert indexed["B1"] == plain["B1"]
+        assert indexed["B2"] == plain["B2"]
+
+    def test_random_updates(self):
+        rng = random.Random(0)
+        grid = Grid()
+        for row in range(50):
+            for col in range(3):
+                grid[row, col] = str(rng.randint(-9, 9))
+        index = RangeIndex(grid)
+        for _ in range(200):
+            row, col = rng.randrange(50), rng.randrange(3)
+            grid[row, col] = str(rng.choice([rng.randint(-9, 9), 0.25]))
+            index.update(row, col)
+            row0, row1 = sorted((rng.randrange(50), rng.randrange(50)))
+            col0, col1 = sorted((rng.randrange(3), rng.randrange(3)))
+            expected = sum(
+                grid.cell(r, c)
+                for r in range(row0, row1 + 1)
+                for c in range(col0, col1 + 1)
+            )
+            values = [
+                grid.cell(r, c)
+                for c in range(col0, col1 + 1)
+                for r in range(row0, row1 + 1)
+            ]
+            bounds = (row0, col0, row1, col1)
+            if all(type(value) is int for value in values):
+                assert index.sum(bounds) == expected
+            else:
+                assert index.sum(bounds) is None
+            assert index.reduce(bounds, max) == max(values)
+            assert index.reduce(bounds, min) == min(values)
+
+    def test_max_min(self):
+        grid = Grid()
+        for row, raw in enumerate(["3", "3.0", "-1", "2.5", "x"]):
+            grid[row, 0] = raw
+        index = RangeIndex(grid)
+        assert index.reduce((0, 0, 3, 0), max) == 3
+        assert type(index.reduce((0, 0, 3, 0), max)) is int  # the first of 3, 3.0
+        assert type(index.reduce((1, 0, 3, 0), max)) is float
+        assert index.reduce((0, 0, 3, 0), min) == -1
+        assert index.reduce((0, 0, 4, 0), max) is None  # text
+        assert index.reduce((0, 0, 9, 0), min) is None  # empty cells
+
+        # point updates, the trees are rebuilt once the column outgrows them
+        size = index.extrema[0].size
+        grid[2, 0] = "7"
+        index.update(2, 0)
+        assert index.extrema[0].size == size
+        assert index.reduce((0, 0, 3, 0), max) == 7
+        assert index.reduce((0, 0, 3, 0), min) == 2.5
+        grid[20, 0] = "1"
+        index.update(20, 0)
+        assert 0 not in index.extrema
+        assert index.reduce((0, 0, 3, 0), max) == 7
+
+    def test_sheet_with_index(self):
+        cells = {cell_name(row, 0): str(row) for row in range(100)}
+        cells.update(
+            {
+                "B1": "=SUM(A1:A100)",
+                "B2": "=SUM(A1:A3) * 2",
+                "B3": "=SUM(A1:B2)",
+                "B4": "=MAX(A1:A100) - MIN(A2:A99)",
+            }
+        )
+        indexed, plain = Variables(cells), Variables(cells)
+        indexed.range_index = RangeIndex(indexed.grid)
+        assert indexed["B1"] == plain["B1"] == 4950
+        assert indexed["B2"] == plain["B2"] == 6
+        assert indexed["B3"] == plain["B3"] == 4957
+        assert indexed["B4"] == plain["B4"] == 98
+        assert (0, 0, 99, 0) not in indexed.cache  # answered without its column
+
+        # updates reach the cells reading the ranges of the index
+        changed = {"A2", "B1", "B2", "B3", "B4"}
+        assert indexed.set("A2", "10") == plain.set("A2", "10") == changed
+        indexed["A50"] = "1000"
+        plain["A50"] = "1000"
+        assert indexed["B1"] == plain["B1"] == 5910
+        assert indexed["B2"] == plain["B2"] == 24
+        assert indexed["B3"] == plain["B3"] == 5944
+        assert indexed["B4"] == plain["B4"] == 998
+
+
+if __name__ == "__main__":
+    unittest.main()
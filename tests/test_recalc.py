@@ -0,0 +1,141 @@
+import unittest
+from unittest import mock
+
+import recalc
+from recalc import (CircularReferenceError, dependency_graph, topological_levels,
+                    upstream_graph)
+from sheet import Variables
+
+
+class TestRecalc(unittest.TestCase):
+    def test_dependency_graph(self):
+        variables = Variables(
+            {
+                "A1": "1",
+                "A2": "=A1 * 2",
+                "A3": "=SUM(A1:A2)",
+                "B1": "=SUM(A1:A9) + $A$2",
+                "B2": "foo +",
+            }
+        )
+        graph = dependency_graph(variables.grid)
+        # only formula cells are nodes, numbers have nothing to evaluate
+        assert graph == {
+            (1, 0): set(),
+            (2, 0): {(1, 0)},
+            (0, 1): {(1, 0), (2, 0)},
+            (1, 1): set(),
+        }
+
+    def test_topological_levels(self):
+        graph = {(0, 0): set(), (1, 0): {(0, 0)}, (0, 1): {(0, 0), (1, 0)}}
+        assert topological_levels(graph) == [[(0, 0)], [(1, 0)], [(0, 1)]]
+
+    def test_cycles(self):
+        graph = {
+            (0, 0): {(0, 1)},
+            (0, 1): {(0, 2)},
+            (0, 2): {(0, 0)},
+            (0, 3): {(0, 0)},  # downstream of the cycle
+            (0, 4): {(0, 4)},
+        }
+        with self.assertRaisesRegex(CircularReferenceError, "A1, B1, C1, E1$"):
+            topological_levels(graph)
+
+    def test_deep_chain(self):
+        variables = Variables({"A1": "1"})
+        for n in range(2, 5001):
+            variables[f"A{n}"] = f"=A{n - 1} + 1"
+        variables.recalculate()
+        assert variables["A5000"] == 5000
+
+    def test_read_deep_chain(self):
+        # reading a cell evaluates the cells upstream of it in dependency order
+        variables = Variables({"A1": "1"})
+        for n in range(2, 5001):
+            variables[f"A{n}"] = f"=A{n - 1} + 1"
+        assert variables["A5000"] == 5000
+        assert variables.set("A1", "2") == {f"A{n}" for n in range(1, 5001)}
+        assert variables["A5000"] == 5001
+
+    def test_read_cells_one_at_a_time(self):
+        # the formula cells of each column are indexed once, not on every read
+        cells = {"D1": "=1", "D2": "=0"}
+        for row in range(1, 2001):
+            cells[f"A{row}"], cells[f"B{row}"] = str(row), f"=A{row} + MAX(D1:D2)"
+        variables = Variables(cells)
+        with mock.patch("sheet.formula_rows", wraps=recalc.formula_rows) as rows:
+            for row in range(1, 2001):
+                assert variables[f"B{row}"] == row + 1
+            variables["C1"] = "=B2"
+            variables["B3"] = "4"
+            assert variables.formula_index()[1][:3] == [0, 1, 3]
+            assert variables.formula_index()[2] == [0]
+            assert variables["C1"] == 3
+        assert rows.call_count == 1
+        assert variables.formula_index() == recalc.formula_rows(variables.grid)
+
+    def test_upstream_graph(self):
+        variables = Variables(
+            {"A1": "=1", "A2": "=A1", "A3": "=SUM(A1:A2)", "B1": "=A3", "B2": "=A1"}
+        )
+        rows = recalc.formula_rows(variables.grid)
+        graph = upstream_graph(variables.grid, {}, rows, (0, 1), lambda p: False)
+        assert graph == {
+            (0, 1): {(2, 0)},
+            (2, 0): {(0, 0), (1, 0)},
+            (1, 0): {(0, 0)},
+            (0, 0): set(),
+        }
+        graph = upstream_graph(variables.grid, {}, rows, (0, 1), lambda p: p == (1, 0))
+        assert graph == {(0, 1): {(2, 0)}, (2, 0): {(0, 0)}, (0, 0): set()}
+
+    def test_upstream_errors_are_raised_when_read(self):
+        variables = Variables(
+            {"A1": "=1 / 0", "A2": "=IFERROR(A1, 5)", "A3": "=A2 + 1", "B1": "=A1"}
+        )
+        assert variables["A3"] == 6
+        self.assertRaises(ZeroDivisionError, variables.__getitem__, "B1")
+
+    def test_circular_cells(self):
+        variables = Variables({"A1": "=B1", "B1": "=SUM(A1:A2)"})
+        self.assertRaises(CircularReferenceError, variables.recalculate)
+        with self.assertRaisesRegex(CircularReferenceError, "A1 -> B1 -> "):
+            variables["A1"]
+
+    @mock.patch.object(recalc, "PARALLEL_BATCH_SIZE", 4)
+    def test_parallel_recalculate(self):
+        raw = {}
+        for row in range(1, 21):
+            raw.update({f"A{row}": str(row), f"B{row}": f"{row}.5"})
+            raw[f"C{row}"] = f"=MAX(A{row}:B{row}) * 2 + $A${row}"
+            raw[f"D{row}"] = f"=C{row} - A1"
+        raw["E1"] = "=SUM(D1:D20)"
+
+        sequential, parallel = Variables(raw), Variables(raw)
+        sequential.recalculate()
+        parallel.recalculate(jobs=2)
+        formulas = [cell for cell, value in raw.items() if value.startswith("=")]
+        assert all(cell in parallel.cache for cell in formulas)
+        for cell in raw:
+            assert parallel[cell] == sequential[cell], cell
+
+        # edges of the cells evaluated on the workers are kept
+        parallel["A1"] = "100"
+        sequential["A1"] = "100"
+        assert "C1" not in parallel.cache and "D20" not in parallel.cache
+        assert parallel["E1"] == sequential["E1"]
+
+    def test_snapshot_batch(self):
+        variables = Variables(
+            {"A1": "1", "B1": "2", "A2": "3", "C1": "=MAX(A1:B1) + $A$1 + SUM(A2:A2)"}
+        )
+        formulas, values = recalc.snapshot_batch(variables, [(0, 2)])
+        # single cells are shipped by name only, not as a range of one cell
+        assert list(values.columns) == [(0, 0, 0, 1)]
+        assert values == {"$A$1": 1, "A1": 1, "A2": 3}
+        assert recalc.evaluate_batch((formulas, values)) == [6]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+
+from main import csv2variables, variables2csv
+from server import SheetServer
+from tests.csvfiles import CsvFiles
+
+SHEET = "1,2,=A1 + B1\n3,4,=SUM(A1:B2)\n"
+
+
+class TestServer(CsvFiles, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.filename = self.write_csv(SHEET)
+        server = SheetServer()
+        self.listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+
+    async def request(self, *requests: dict) -> dict:
+        "sends pipelined requests on a connection, returns the responses by id"
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", self.port, limit=1 << 24  # dumps are single lines
+        )
+        for n, request in enumerate(requests):
+            writer.write(json.dumps({"id": n, **request}).encode() + b"\n")
+        writer.write(b"not json\n")
+        writer.write_eof()
+        responses = [json.loads(line) async for line in reader]
+        writer.close()
+        invalid = [response for response in responses if "id" not in response]
+        assert invalid[0]["error"].startswith("JSONDecodeError"), invalid
+        return {response["id"]: response for response in responses if "id" in response}
+
+    async def test_session(self):
+        sheet = {"sheet": self.filename}
+        responses = await self.request(
+            {"op": "open", **sheet},
+            {"op": "get", "cell": "C2", **sheet},
+            {"op": "set", "cell": "A1", "value": "=10", **sheet},
+            {"op": "dump", **sheet},
+            {"op": "get", "cell": "C2", "sheet": "missing"},
+            {"op": "unknown"},
+        )
+        assert responses[0]["shape"] == [2, 3]
+        assert responses[1] == {"id": 1, "value": 10, "formula": "=SUM(A1:B2)"}
+        assert responses[2]["value"] == 10 and responses[2]["updated"] == ["C2"]
+        assert responses[3]["csv"] == "10,2,12\n3,4,19\n"
+        assert responses[4]["error"].startswith("KeyError: \"sheet 'missing'")
+        assert responses[5]["error"] == "ValueError: unknown operation: 'unknown'"
+
+        # sheets are kept between connections
+        responses = await self.request({"op": "get", "cell": "C1", **sheet})
+        assert responses[0]["value"] == 12
+        responses = await self.request({"op": "close", **sheet}, {"op": "list"})
+        assert responses[1]["sheets"] == []
+
+    async def test_sheets_evaluated_concurrently(self):
+        # the sheets share the compiled formula and its common subexpression
+        formula = "=(A{0} * 2 + B{0}) * (A{0} * 2 + B{0}) + (A{0} * 2 + B{0})"
+        filenames = [
+            self.write_csv(
+                "".join(
+                    f"{row * scale},{row},{formula.format(row)}\n"
+                    for row in range(1, 3001)
+                )
+            )
+            for scale in (1, 1000)
+        ]
+        expected = ["".join(variables2csv(csv2variables(f))) for f in filenames]
+        requests = [{"op": "open", "sheet": f} for f in filenames]
+        await self.request(*requests)
+        responses = await self.request(
+            *[{"op": "dump", "sheet": f} for f in filenames * 2]
+        )
+        assert [responses[n]["csv"] for n in range(4)] == expected * 2
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from interpreter import parse_formula
+from shared import relative_formula, share_formulas, shared_references
+from sheet import Variables
+
+
+class TestShared(unittest.TestCase):
+    def test_relative_formula(self):
+        assert relative_formula("A1 + $B$2", 0, 0) == "R[0]C[0] + R2C2"
+        assert relative_formula("SUM(A1:C1)", 4, 3) == "SUM(R[-4]C[-3]:R[-4]C[-1])"
+        assert relative_formula("$A2 * B$1", 1, 1) == "R[0]C1 * R1C[0]"
+        # strings and function names are not references
+        assert relative_formula('LOG10(A2) & "A2"', 1, 0) == 'LOG10(R[0]C[0]) & "A2"'
+        # nor numbers in scientific notation
+        assert relative_formula("1E5 + A1", 0, 0) == "1E5 + R[0]C[0]"
+        assert relative_formula("1E6 + A2", 1, 0) == "1E6 + R[0]C[0]"
+        assert relative_formula("A1 +", 0, 0) == "R[0]C[0] +"
+        assert relative_formula("A1 # 2", 0, 0) == "A1 # 2"  # not a formula
+
+    def test_scientific_notation_is_not_shared(self):
+        variables = Variables({"A1": "=1E5", "A2": "=1E6", "B1": "=2e3", "B2": "=2e3"})
+        variables.share_formulas()
+        assert set(variables.shared) == {(0, 1), (1, 1)}
+        variables.recalculate()
+        assert (variables["A1"], variables["A2"]) == (100000.0, 1000000.0)
+        assert variables["B2"] == 2000.0
+
+    def test_share_formulas(self):
+        formulas = {
+            (0, 3): "MAX(A1:C1) + $E$1",
+            (1, 3): "MAX(A2:C2) + $E$1",
+            (2, 3): "MAX(A3:C3) + $E$2",
+            (3, 3): "MAX(A4:C4) + $E$1",
+            (0, 4): "D1 * 2",
+        }
+        shared = share_formulas(formulas)
+        assert set(shared) == {(0, 3), (1, 3), (3, 3)}
+        group = shared[3, 3]
+        assert (group.formula, group.row, group.col) == (formulas[0, 3], 0, 3)
+        refs = shared_references(group, 3, 3)
+        assert sorted(refs) == [("$E$1", "$E$1"), ("A4", "C4")]
+
+    def test_filled_formulas_are_parsed_once(self):
+        n = 500
+        cells = {}
+        for row in range(1, n + 1):
+            cells[f"A{row}"] = str(row)
+            cells[f"B{row}"] = f"=A{row} * $A$1 + SUM($A$1:A{row})"
+            cells[f"C{row}"] = f"=IF(B{row} > 100, B{row}, 0)"
+        cells["D1"] = "=SUM(C1:C500)"
+        reference = Variables(cells)
+        variables = Variables(cells)
+        variables.share_formulas()
+        assert len(set(map(id, variables.shared.values()))) == 2
+
+        parse_formula.cache_clear()
+        variables.recalculate()
+        assert parse_formula.cache_info().misses < 10
+        for row in range(1, n + 1):
+            for col in "BC":
+                assert variables[f"{col}{row}"] == reference[f"{col}{row}"]
+        assert variables["D1"] == reference["D1"]
+
+        # edited cells leave their group, the rest of the group is updated
+        assert variables.set("B3", "=1") == {"B3"}
+        assert variables.set("A2", "5") >= {"A2", "B2", "B400", "C400"}
+        assert variables["B400"] == 400 + sum(range(1, 401)) + 3
+        assert variables["B3"] == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from unittest import mock
+
+from sheet import Variables
+
+
+class TestVariables(unittest.TestCase):
+    def test_cells_are_memoized(self):
+        # each row sums all the previous rows, exponential without a cache
+        variables = Variables({"A1": "1"})
+        for n in range(2, 41):
+            variables[f"A{n}"] = f"=SUM(A1:A{n - 1})"
+        assert variables["A40"] == 2**38
+        # only formulas are cached, A1 is read from the grid
+        assert len([key for key in variables.cache if isinstance(key, str)]) == 39
+
+    def test_invalidate_downstream_cells(self):
+        variables = Variables(
+            {
+                "A1": "1",
+                "A2": "2",
+                "B1": "=MAX(A1:A2)",
+                "B2": "=SUM(B1:B1) * 10",
+                "C1": "3",
+            }
+        )
+        assert variables["B2"] == 20
+        assert variables["C1"] == 3
+        # small ranges are linked to each of their cells
+        assert variables.ranges == set()
+        assert variables.dependents["A1"] == {(0, 0, 1, 0)}
+        assert variables.dependents[(0, 0, 1, 0)] == {"B1"}
+        assert variables.dependents["B1"] == {(0, 1, 0, 1)}
+        assert variables.dependents[(0, 1, 0, 1)] == {"B2"}
+
+        variables["A1"] = "5"
+        assert "B1" not in variables.cache
+        assert "B2" not in variables.cache
+        assert "C1" in variables.cache
+        assert variables["B2"] == 50
+
+    def test_range_columns_are_shared(self):
+        variables = Variables({"A1": "1", "A2": "2", "A3": "3.5"})
+        variables["B1"] = "=SUM(A1:A2)"
+        variables["B2"] = "=MAX(A1:A2) + MIN(A1:A2)"
+        assert variables["B1"] == variables["B2"] == 3
+        assert variables.dependents[(0, 0, 1, 0)] == {"B1", "B2"}
+        assert list(variables.range_column((0, 0, 1, 0))) == [1, 2]
+        # mixed types are kept as a list
+        assert variables.range_column((0, 0, 2, 0)) == [1, 2, 3.5]
+
+        variables["A2"] = "10"
+        assert variables["B1"] == 11
+        assert variables["B2"] == 11
+
+    def test_large_ranges_are_invalidated_by_bounds(self):
+        variables = Variables({f"A{n}": str(n) for n in range(1, 101)})
+        variables["B1"] = "=SUM(A1:A100)"
+        variables["B2"] = "=MAX(A1:A100)"
+        assert variables["B1"] == 5050
+        assert variables["B2"] == 100
+        # no edges from each cell of the range
+        assert variables.ranges == {(0, 0, 99, 0)}
+        assert "A50" not in variables.dependents
+
+        variables["A50"] = "=A49 * 10"
+        assert variables["B1"] == 5050 - 50 + 490
+        assert variables["B2"] == 490
+        variables["A49"] = "1"
+        assert variables["B2"] == 100
+        assert variables["B1"] == 5050 - 50 + 10 - 48
+
+    def test_set_returns_changed_cells(self):
+        variables = Variables(
+            {
+                "A1": "1",
+                "A2": "2",
+                "B1": "=A1 + A2",
+                "B2": "=B1 > 0",
+                "C1": "=B2 * 10",
+                "D1": "=SUM(B1:B2)",
+            }
+        )
+        variables.recalculate()
+        assert variables.set("A1", "5") == {"A1", "B1", "D1"}
+        # B2 is still true so C1 is not recomputed
+        assert variables.cache["C1"] == 10
+        assert variables["D1"] == 8
+        assert variables.set("A1", "5") == set()
+        assert variables.set("$A$2", "1.0") == {"A2", "B1", "D1"}
+        assert variables.set("B2", "=B1 * 2") == {"B2", "C1", "D1"}
+        assert (variables["C1"], variables["D1"]) == (120, 18)
+        # everything is already cached, nothing to recalculate
+        with mock.patch("sheet.topological_levels") as topological_levels:
+            variables.recalculate()
+        topological_levels.assert_not_called()
+
+    def test_set_large_ranges(self):
+        variables = Variables({f"A{n}": "1" for n in range(1, 101)})
+        variables["B1"] = "=SUM(A1:A100)"
+        variables["B2"] = "=MAX(A1:A100)"
+        variables["C1"] = "=B1 + B2"
+        variables.recalculate()
+        assert variables.set("A7", "3") == {"A7", "B1", "B2", "C1"}
+        assert variables.set("A8", "2") == {"A8", "B1", "C1"}
+        assert variables["C1"] == 103 + 3
+        assert variables.set("D1", "1") == {"D1"}
+
+    def test_untaken_branches_are_not_evaluated(self):
+        variables = Variables(
+            {"A1": "1", "B1": "=1 / 0", "C1": "=IF(A1 > 0, A1, B1)", "D1": '"x"'}
+        )
+        assert variables["C1"] == 1
+        assert "B1" not in variables.dependents
+        variables["E1"] = "=IFERROR(B1, D1)"
+        assert variables["E1"] == "x"
+        assert variables.set("A1", "2") == {"A1", "C1"}
+        self.assertRaises(ZeroDivisionError, variables.set, "A1", "0")
+        self.assertRaises(ZeroDivisionError, variables.__getitem__, "C1")
+
+    def test_missing_cells_are_tracked(self):
+        variables = Variables({"A1": "=B1"})
+        assert variables["A1"] == ""
+        variables["B1"] = "7"
+        assert variables["A1"] == 7
+
+    def test_int_sums_dont_overflow(self):
+        big, exact = str(2**62), str(2**53)  # a text cell and a number of the grid
+        variables = Variables({"A1": big, "A2": big, "B1": "=SUM(A1:A2)"})
+        assert variables["B1"] == 2**63
+        cells = {f"A{row}": exact for row in range(1, 1101)}
+        variables = Variables({**cells, "B1": "=SUM(A1:A1100)"})
+        assert variables["B1"] == 1100 * 2**53
+
+    def test_grid_storage(self):
+        variables = Variables({"A1": "1", "B2": "2.5", "C3": "=A1", "$D$1": "x"})
+        assert variables.grid.shape == (3, 4)
+        assert variables.raw("A1") == "1"
+        assert variables.raw("B2") == "2.5"
+        assert variables.raw("C3") == "=A1"
+        assert variables.raw("D1") == "x"
+        assert variables.grid.texts == {(2, 2): "=A1", (0, 3): "x"}
+        assert list(variables) == ["A1", "D1", "B2", "C3"]
+        assert variables["$C$3"] == variables["C3"] == 1
+        assert "A1" in variables and "A2" not in variables
+
+        del variables["A1"]
+        assert variables["C3"] == ""
+        self.assertRaises(KeyError, variables.__getitem__, "foo")
+        self.assertRaises(KeyError, variables.__setitem__, "A0", "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from main import cached_csv2variables, csv2variables, variables2csv
+from snapshot import (changed_cells, file_digest, read_snapshot, save_snapshot,
+                      snapshot_digest, snapshot_path)
+from tests.csvfiles import CsvFiles
+
+SHEET = (
+    '1,2.5,=A1 * B1,"=IF(C1 > 2, ""big"", ""small"")"\n'
+    "3,4,=SUM(A1:B2),=C2 > 10\n"
+    + "".join(f"{n},=A{n + 2} * 2\n" for n in range(1, 70))
+    + '=SUM(A1:A71),"=MAX(B3:B71, 0)"\n'
+)
+
+
+class TestSnapshot(CsvFiles, unittest.TestCase):
+    def evaluate(self, filename: str) -> str:
+        digest = file_digest(filename)
+        variables = cached_csv2variables(filename, digest)
+        csv_out = "".join(variables2csv(variables))
+        save_snapshot(variables, filename, digest)
+        return csv_out
+
+    def test_round_trip(self):
+        filename = self.write_csv(SHEET)
+        variables = csv2variables(filename)
+        expected = "".join(variables2csv(variables))
+        save_snapshot(variables, filename)
+        snapshot = read_snapshot(filename)
+        assert snapshot.digest == snapshot_digest(filename) == file_digest(filename)
+        assert snapshot.grid.texts == variables.grid.texts
+        assert changed_cells(snapshot.grid, variables.grid) == []
+        assert snapshot.values[0, 2] == 2.5 and snapshot.values[1, 3] is True
+        assert snapshot.values[0, 3] == "big"
+        assert set(variables.ranges) == {snapshot.keys[i] for i in snapshot.ranges}
+
+        restored = cached_csv2variables(filename, file_digest(filename))
+        assert restored.cache["C2"] == 10.5
+        # the groups of shared formulas are restored, one parsed formula per group
+        assert restored.shared == variables.shared and len(restored.shared) == 69
+        assert len({id(group) for group in restored.shared.values()}) == 1
+        assert restored.dependents == variables.dependents
+        assert "".join(variables2csv(restored)) == expected
+
+    def test_changed_cells_are_recomputed(self):
+        filename = self.write_csv(SHEET)
+        self.evaluate(filename)
+        for content in [
+            SHEET.replace("3,4,", "3,5,"),  # a number read by a small range
+            SHEET.replace("\n5,", "\n50,"),  # a number read by a large range
+            SHEET.replace("=A1 * B1", "=A1 - B1"),  # a formula
+            SHEET.replace("=A3 * 2", "=A3 * 3"),  # the first formula of a group
+            SHEET + "7,8\n",  # a new row
+            SHEET.rsplit("\n", 2)[0] + "\n",  # a removed row
+        ]:
+            self.write_csv(content, filename)
+            expected = "".join(variables2csv(csv2variables(filename)))
+            assert self.evaluate(filename) == expected, content
+            assert self.evaluate(filename) == expected, content
+
+    def test_changed_cells(self):
+        old = csv2variables(self.write_csv("1,=A1\n2,x\n")).grid
+        new = csv2variables(self.write_csv("1,=A1 + 1\n2.0,x,3\n")).grid
+        assert changed_cells(old, new) == [(0, 1), (1, 0), (1, 2)]
+        assert changed_cells(new, old) == [(0, 1), (1, 0), (1, 2)]
+
+    def test_unreadable_snapshot(self):
+        filename = self.write_csv(SHEET)
+        assert read_snapshot(filename) is None and snapshot_digest(filename) is None
+        snapshot_path(filename).write_bytes(b"not a snapshot")
+        assert read_snapshot(filename) is None and snapshot_digest(filename) is None
+        expected = "".join(variables2csv(csv2variables(filename)))
+        assert self.evaluate(filename) == expected
+
+
+if __name__ == "__main__":
+    unittest.main()
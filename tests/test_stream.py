@@ -0,0 +1,36 @@
+import unittest
+
+from main import csv2variables, variables2csv
+from stream import RowWindow, scan_csv, stream_csv
+from tests.csvfiles import CsvFiles
+
+ROW_LOCAL = "1,2,3,=MAX(A1:C1)\n" * 5 + "=A5+1,=B5*2,,=SUM(D1:D5)\n\n4,5\n"
+FORWARD = "=A2,1\n2,3\n"
+
+
+class TestStream(CsvFiles, unittest.TestCase):
+    def test_scan_csv(self):
+        assert scan_csv(self.write_csv(ROW_LOCAL)) == (4, 5, 0)
+        assert scan_csv(self.write_csv(FORWARD)) == (2, 0, 1)
+
+    def test_stream_matches_buffered_output(self):
+        filename = self.write_csv(ROW_LOCAL)
+        n_cols, back, _ = scan_csv(filename)
+        streamed = "".join(stream_csv(filename, n_cols, back))
+        buffered = "".join(variables2csv(csv2variables(filename)))
+        assert streamed == buffered, (streamed, buffered)
+
+    def test_row_window(self):
+        window = RowWindow()
+        window.push(["A1", "B1"], ["1", "=A1 * 2"])
+        window.push(["A2", "B2"], ["=B1 + 1", ""])
+        assert window["A2"] == 3
+        assert window["$B$1"] == 2
+        assert window["B2"] == ""
+        window.evict()
+        assert len(window.rows) == 1
+        assert dict(window) == {"A2": 3, "B2": ""}
+
+
+if __name__ == "__main__":
+    unittest.main()
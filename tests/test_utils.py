@@ -1,7 +1,10 @@
 import unittest
+from itertools import islice
 
 from lexer import lexer
-from utils import parse_function_args, parse_parenthesis_expr
+from utils import (alphabetical_generator, arange, cell_index, cell_name,
+                   column_index, column_name, excel_range, parse_function_args,
+                   parse_parenthesis_expr)
 
 
 class TestUtils(unittest.TestCase):
@@ -71,6 +74,30 @@ class TestUtils(unittest.TestCase):
         assert len(args) == 3
         assert tuple(len(arg) for arg in args) == (7, 3, 8)
 
+    def test_cell_addressing(self):
+        columns = ((0, "A"), (25, "Z"), (26, "AA"), (701, "ZZ"), (16383, "XFD"))
+        for index, name in columns:
+            assert column_name(index) == name
+            assert column_index(name) == index
+
+        assert cell_index("A1") == (0, 0)
+        assert cell_index("$AB$12") == (11, 27)
+        assert cell_name(11, 27) == "AB12"
+        for cell in ("A0", "1A", "a1", "A"):
+            self.assertRaises(ValueError, cell_index, cell)
+
+        # beyond the lookup table columns are computed in base 26
+        assert column_name(16384) == "XFE"
+        assert column_index(column_name(10**6)) == 10**6
+
+    def test_column_ranges(self):
+        assert list(islice(alphabetical_generator(), 25, 28)) == ["Z", "AA", "AB"]
+        assert list(arange("Y", "AB")) == ["Y", "Z", "AA", "AB"]
+        assert len(list(arange("A", "XFD"))) == 16384
+        assert list(excel_range("A1", "B2")) == ["A1", "A2", "B1", "B2"]
+        assert list(excel_range("$Z$9", "AA10")) == ["Z9", "Z10", "AA9", "AA10"]
+        assert len(list(excel_range("A1", "XFD2"))) == 2 * 16384
+
 
 if __name__ == "__main__":
     unittest.main()